@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from train_and_test.config import BASE_DIR
+
+# Local server: bypass any http_proxy from the environment.
+OPENER = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+LISTING = {"listing_id": 1, "total_area": 54.0, "rooms_count": 2, "city": "Москва", "lat": 55.75, "lon": 37.6}
+
+
+def _status(url: str, body: bytes = None) -> int:
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    try:
+        with OPENER.open(request, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return 0
+
+
+def measure(env: dict, port: int, timeout: float = 60) -> dict:
+    # Seconds from spawning uvicorn until liveness, readiness and the first
+    # 200 from /predict, polled every few milliseconds.
+    base = f"http://127.0.0.1:{port}"
+    body = json.dumps(LISTING).encode()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server.api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    timings = {}
+    try:
+        while "first_prediction" not in timings:
+            if time.perf_counter() - started > timeout or process.poll() is not None:
+                raise RuntimeError(f"Server did not serve a prediction within {timeout}s")
+            if "live" not in timings:
+                if _status(f"{base}/health/live") == 200:
+                    timings["live"] = time.perf_counter() - started
+            elif "ready" not in timings:
+                if _status(f"{base}/health/ready") == 200:
+                    timings["ready"] = time.perf_counter() - started
+            elif _status(f"{base}/predict", body) == 200:
+                timings["first_prediction"] = time.perf_counter() - started
+            time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait()
+    return timings
+
+
+def report(modes: dict, repeats: int, port: int) -> dict:
+    results = {}
+    for name, env in modes.items():
+        runs = [measure(env, port) for _ in range(repeats)]
+        results[name] = {stage: statistics.median(run[stage] for run in runs) for stage in runs[0]}
+        print(f"{name:<10} " + "  ".join(f"{stage} {seconds * 1000:>7.0f} ms"
+                                         for stage, seconds in results[name].items()))
+    return results
+
+
+if __name__ == "__main__":
+    from server.bundle import BUNDLE_PATH
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bundle", default=BUNDLE_PATH)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    report({"artifacts": {"SERVING_BUNDLE": ""},
+            "bundle": {"SERVING_BUNDLE": args.bundle}},
+           args.repeats, args.port)
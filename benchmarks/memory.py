@@ -0,0 +1,135 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.run import _load_ensemble
+from benchmarks.synthetic import synthetic_listings, synthetic_raw
+from train_and_test.config import BASE_DIR, FEATURES
+
+logger = logging.getLogger(__name__)
+
+RESULTS_PATH = os.path.join(BASE_DIR, "benchmarks", "memory_results.json")
+
+SIZES = [10_000, 100_000]
+# Raw predictions kept per run for the tolerance check against a baseline.
+PREDICTION_ROWS = 1000
+
+
+def pipeline_prepare_data(rows: int):
+    from train_and_test.features_engineering import prepare_data
+    raw = synthetic_raw(rows)
+    return lambda: prepare_data(raw)
+
+
+def pipeline_adapter(rows: int):
+    from server.adapter import adapter
+    flats = synthetic_listings(rows)
+    return lambda: adapter(flats)
+
+
+PIPELINES = {
+    "prepare_data": pipeline_prepare_data,
+    "adapter": pipeline_adapter,
+}
+
+
+def measure(fn) -> tuple:
+    # Peak is what the call allocates on top of its (already built) input;
+    # numpy and pandas buffers are traced too.
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        df = fn()
+        seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return df, peak, seconds
+
+
+def run(sizes: list, pipelines: list) -> dict:
+    version, ensemble = _load_ensemble()
+    if ensemble is None:
+        logger.warning("No trained model, predictions are not recorded")
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    for name in pipelines:
+        for rows in sizes:
+            df, peak, seconds = measure(PIPELINES[name](rows))
+            result = {
+                "pipeline": name,
+                "rows": rows,
+                "peak_mb": peak / 2 ** 20,
+                "frame_mb": df.memory_usage(deep=True).sum() / 2 ** 20,
+                "seconds": seconds,
+                "dtypes": df.dtypes.astype(str).str.replace(r"category.*", "category", regex=True)
+                                   .value_counts().to_dict(),
+            }
+            if ensemble is not None:
+                result["predictions"] = ensemble.predict(df[FEATURES].iloc[:PREDICTION_ROWS]).tolist()
+            results.append(result)
+            print(f"{name:<14} {rows:>9} rows  peak {result['peak_mb']:>8.1f} MB  "
+                  f"frame {result['frame_mb']:>8.1f} MB  {seconds:>7.2f} s")
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "model_version": version,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    previous = {(r["pipeline"], r["rows"]): r for r in baseline["results"]}
+    mismatches = []
+    for result in current["results"]:
+        before = previous.get((result["pipeline"], result["rows"]))
+        if before is None:
+            continue
+        line = (f"{result['pipeline']:<14} {result['rows']:>9} rows  "
+                f"peak {before['peak_mb']:>8.1f} -> {result['peak_mb']:>8.1f} MB  "
+                f"frame {before['frame_mb']:>8.1f} -> {result['frame_mb']:>8.1f} MB")
+        if "predictions" in result and "predictions" in before:
+            new, old = np.asarray(result["predictions"]), np.asarray(before["predictions"])
+            diff = float(np.max(np.abs(new - old) / np.abs(old)))
+            line += f"  max rel diff {diff:.2e}"
+            if diff > tolerance:
+                line += "  MISMATCH"
+                mismatches.append({"pipeline": result["pipeline"], "rows": result["rows"], "max_rel_diff": diff})
+        print(line)
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--pipelines", nargs="+", choices=list(PIPELINES), default=list(PIPELINES))
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--compare", help="baseline results file to check against")
+    parser.add_argument("--tolerance", type=float, default=1e-6,
+                        help="allowed relative difference of raw predictions from the baseline")
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.pipelines)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.warning(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        mismatches = compare(report, baseline, args.tolerance)
+        if mismatches:
+            logger.warning(f"{len(mismatches)} run(s) predict further from the baseline than {args.tolerance:g}")
+            sys.exit(1)
@@ -0,0 +1,222 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Every synthetic row is scored for real; repeats must not be served from
+# the prediction cache.
+os.environ.setdefault("PREDICTION_CACHE_SIZE", "0")
+
+import joblib
+import numpy as np
+
+from benchmarks.synthetic import synthetic_listings, synthetic_raw
+from train_and_test.config import BASE_DIR, FEATURES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ARTIFACTS_DIR = os.path.join(BASE_DIR, "server", "artifacts")
+RESULTS_PATH = os.path.join(BASE_DIR, "benchmarks", "results.json")
+
+SIZES = [1, 100, 10_000, 1_000_000]
+# Single /predict calls through the ASGI test client cost ~5 ms each, so
+# they stop at 1000 requests; the batch endpoint goes up to 10k rows. Past
+# that an API run takes minutes and tells nothing the stage timings don't.
+API_PREDICT_MAX_ROWS = 1000
+API_MAX_ROWS = 10_000
+
+
+def repeats_for(rows: int) -> int:
+    if rows <= 100:
+        return 50
+    if rows <= 10_000:
+        return 5
+    return 1
+
+
+def _timed(fn, repeats: int) -> float:
+    fn()
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def _records(flats) -> list:
+    return flats.astype(object).where(flats.notna(), None).to_dict("records")
+
+
+def _load_ensemble():
+    from train_and_test.ensemble import MODEL_PATH, load_ensemble, model_version
+    if not os.path.exists(MODEL_PATH):
+        return None, None
+    with open(MODEL_PATH, "rb") as f:
+        payload = f.read()
+    return model_version(payload), load_ensemble(payload)
+
+
+def _api_client():
+    from fastapi.testclient import TestClient
+    from server.api import app
+    client = TestClient(app)
+    # Entering runs the lifespan, which loads the model in the background.
+    client.__enter__()
+    while (response := client.get("/health/ready")).status_code != 200:
+        if response.json()["status"] == "failed":
+            raise RuntimeError(f"Model failed to load: {response.json()['detail']}")
+        time.sleep(0.01)
+    return client
+
+
+def stage_prepare_data(rows: int, state: dict):
+    from train_and_test.features_engineering import prepare_data
+    raw = synthetic_raw(rows)
+    return lambda: prepare_data(raw.copy())
+
+
+def stage_adapter(rows: int, state: dict):
+    from server.adapter import adapter
+    flats = synthetic_listings(rows)
+    return lambda: adapter(flats)
+
+
+def stage_adapt_flat(rows: int, state: dict):
+    from server.adapter import adapt_flat
+    from server.FlatRawInfo import FlatRawInfo
+    if rows > API_MAX_ROWS:
+        return None
+    flats = [FlatRawInfo.model_validate(record) for record in _records(synthetic_listings(rows))]
+    return lambda: [adapt_flat(flat) for flat in flats]
+
+
+def stage_ensemble(rows: int, state: dict):
+    from server.adapter import adapter
+    if state["ensemble"] is None:
+        return None
+    X = adapter(synthetic_listings(rows))[FEATURES]
+    return lambda: state["ensemble"].predict(X)
+
+
+def stage_calibration(rows: int, state: dict):
+    from server.adapter import adapter
+    from train_and_test.postproccesing import calibrate_predictions
+    df_prepared = adapter(synthetic_listings(rows))
+    predictions = np.random.default_rng(0).lognormal(11, 0.6, rows)
+    return lambda: calibrate_predictions(predictions, state["calibration"], df_prepared)
+
+
+def stage_api_predict(rows: int, state: dict):
+    if state["client"] is None or rows > API_PREDICT_MAX_ROWS:
+        return None
+    records = _records(synthetic_listings(rows))
+    client = state["client"]
+
+    def run():
+        for record in records:
+            client.post("/predict", json=record).raise_for_status()
+    return run
+
+
+def stage_api_predict_batch(rows: int, state: dict):
+    if state["client"] is None or rows > API_MAX_ROWS:
+        return None
+    records = _records(synthetic_listings(rows))
+    client = state["client"]
+    return lambda: client.post("/predict/batch", json=records).raise_for_status()
+
+
+STAGES = {
+    "prepare_data": stage_prepare_data,
+    "adapter": stage_adapter,
+    "adapt_flat": stage_adapt_flat,
+    "ensemble": stage_ensemble,
+    "calibration": stage_calibration,
+    "api_predict": stage_api_predict,
+    "api_predict_batch": stage_api_predict_batch,
+}
+
+
+def run(sizes: list, stages: list) -> dict:
+    version, ensemble = _load_ensemble()
+    if ensemble is None:
+        logger.info("No trained model, skipping ensemble and API stages")
+    state = {
+        "ensemble": ensemble,
+        "calibration": joblib.load(os.path.join(ARTIFACTS_DIR, "calibration.pkl")),
+        "client": _api_client() if ensemble is not None else None,
+    }
+    # Stage output (per-batch "raw:" arrays, calibration steps) would drown
+    # the report and cost time of its own.
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    for name in stages:
+        for rows in sizes:
+            fn = STAGES[name](rows, state)
+            if fn is None:
+                results.append({"stage": name, "rows": rows, "skipped": True})
+                print(f"{name:<18} {rows:>9} rows  skipped")
+                continue
+            repeats = repeats_for(rows)
+            seconds = _timed(fn, repeats)
+            results.append({"stage": name, "rows": rows, "repeats": repeats,
+                            "seconds": seconds, "per_row_us": seconds / rows * 1e6})
+            print(f"{name:<18} {rows:>9} rows  {seconds * 1000:>10.2f} ms  {seconds / rows * 1e6:>9.2f} us/row")
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model_version": version,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    previous = {(r["stage"], r["rows"]): r for r in baseline["results"] if not r.get("skipped")}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get((result["stage"], result["rows"]))
+        if result.get("skipped") or before is None:
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{result['stage']:<18} {result['rows']:>9} rows  "
+              f"{before['seconds'] * 1000:>10.2f} -> {result['seconds'] * 1000:>10.2f} ms  x{ratio:.2f}  {flag}")
+        if flag:
+            regressions.append({**result, "baseline_seconds": before["seconds"], "ratio": ratio})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--compare", help="baseline results file to check against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown before a stage counts as a regression")
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.stages)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.warning(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            logger.warning(f"{len(regressions)} stage(s) slower than the baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
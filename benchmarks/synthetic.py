@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+CITIES = {
+    'Москва': (55.7558, 37.6173),
+    'Санкт-Петербург': (59.9343, 30.3351),
+    'Свердловская область': (56.8389, 60.6057),
+}
+STREETS = ['улица Арбат', 'Невский проспект', 'улица Малышева', 'Кутузовский проспект',
+           'набережная Канала Грибоедова', 'Ленинский проспект', 'Тверской бульвар']
+RENOVATIONS = ['Косметический', 'Дизайнерский', 'Евроремонт', 'Без ремонта']
+PARKINGS = ['наземная', 'подземная', 'открытая', 'многоуровневая']
+BUILDING_TYPES = ['Кирпичный', 'Монолитно-кирпичный', 'Монолитный', 'Панельный', 'Блочный', 'Старый фонд']
+ROOM_TYPES = ['Изолированная', 'Смежная', 'Оба варианта']
+COMPLEXES = ['Парк Палас', 'Меркурий Тауэр', 'Сердце Столицы', 'Триумф Парк']
+EXTRAS = ['Мебель в комнатах', 'Мебель на кухне', 'Ванна', 'Стиральная машина', 'Кондиционер',
+          'Посудомоечная машина', 'Телевизор', 'Холодильник', 'Интернет', 'Телефон']
+DESCRIPTIONS = [
+    'Сдаётся уютная квартира рядом с метро.',
+    'Просторная квартира с панорамными окнами, консьерж, закрытая территория.',
+    'Квартира после ремонта, вся техника, долгосрочно.',
+    'Двухуровневая квартира с террасой в клубном доме.',
+]
+
+
+def _choice(rng: np.random.Generator, values: list, n: int, missing: float = 0.0) -> np.ndarray:
+    picked = np.asarray(values, dtype=object)[rng.integers(0, len(values), n)]
+    if missing:
+        picked[rng.random(n) < missing] = None
+    return picked
+
+
+def _counts(rng: np.random.Generator, first: str, second: str, n: int) -> np.ndarray:
+    a = rng.integers(0, 3, n)
+    b = rng.integers(0, 3, n)
+    parts = np.where(a > 0, np.char.add(f'{first} (', np.char.add(a.astype(str), ')')), '')
+    other = np.where(b > 0, np.char.add(f'{second} (', np.char.add(b.astype(str), ')')), '')
+    joined = np.where((a > 0) & (b > 0), np.char.add(np.char.add(parts, ', '), other), np.char.add(parts, other))
+    result = joined.astype(object)
+    result[joined == ''] = None
+    return result
+
+
+def synthetic_listings(n: int, seed: int = 0) -> pd.DataFrame:
+    # Columns of FlatRawInfo, one row per listing.
+    rng = np.random.default_rng(seed)
+    city = _choice(rng, list(CITIES), n)
+    city_code = pd.Index(list(CITIES)).get_indexer(city)
+    center = np.array(list(CITIES.values()))[city_code]
+    floors_total = rng.integers(2, 40, n)
+    return pd.DataFrame({
+        'listing_id': np.arange(n),
+        'total_area': np.round(rng.lognormal(4.0, 0.45, n), 1),
+        'rooms_count': rng.integers(1, 6, n),
+        'renovation': _choice(rng, RENOVATIONS, n, missing=0.1),
+        'parking': _choice(rng, PARKINGS, n, missing=0.3),
+        'lat': center[:, 0] + rng.normal(0, 0.08, n),
+        'lon': center[:, 1] + rng.normal(0, 0.12, n),
+        'building_type': _choice(rng, BUILDING_TYPES, n, missing=0.05),
+        'room_type': _choice(rng, ROOM_TYPES, n, missing=0.3),
+        'loggia_count': rng.integers(0, 3, n),
+        'floor': np.minimum(rng.integers(1, 40, n), floors_total),
+        'floors_total': floors_total,
+        'city': city,
+        'street': _choice(rng, STREETS, n, missing=0.2),
+        'complex': _choice(rng, COMPLEXES, n, missing=0.6),
+        'description': _choice(rng, DESCRIPTIONS, n, missing=0.05),
+    })
+
+
+def synthetic_raw(n: int, seed: int = 0) -> pd.DataFrame:
+    # Columns of data/raw/*.xlsx, as read by prepare_data.
+    rng = np.random.default_rng(seed)
+    flats = synthetic_listings(n, seed)
+    rooms = flats['rooms_count'].to_numpy()
+    room_type = flats['room_type'].to_numpy()
+    rooms_text = np.where(pd.isna(room_type), rooms.astype(str),
+                          np.char.add(np.char.add(rooms.astype(str), ', '), room_type.astype(str)))
+    floor = flats['floor'].to_numpy()
+    floors_total = flats['floors_total'].to_numpy()
+    building = np.char.add(np.char.add(floor.astype(str), '/'), floors_total.astype(str))
+    building = np.where(pd.isna(flats['building_type']), building,
+                        np.char.add(np.char.add(building, ', '), flats['building_type'].astype(str).to_numpy()))
+    street = flats['street'].fillna('Центральная площадь').to_numpy().astype(str)
+    address = np.char.add(np.char.add(np.char.add(flats['city'].to_numpy().astype(str), ', '), street), ', 1')
+    extras = np.full(n, '', dtype=object)
+    for extra in EXTRAS:
+        keep = rng.random(n) < 0.6
+        extras[keep] = np.where(extras[keep] == '', extra, extras[keep] + ', ' + extra)
+    extras[extras == ''] = None
+    metro_minutes = rng.integers(1, 60, n).astype(float)
+    area = flats['total_area'].to_numpy()
+
+    return pd.DataFrame({
+        'ID  объявления': flats['listing_id'],
+        'Количество комнат': rooms_text,
+        'Тип': 'Квартира',
+        'Метро': np.char.add(np.char.add('м. Арбатская (', metro_minutes.astype(int).astype(str)), ' мин пешком)'),
+        'Адрес': address,
+        'Площадь, м2': area.astype(str),
+        'Дом': building,
+        'Парковка': flats['parking'],
+        'Описание': flats['description'],
+        'Ремонт': flats['renovation'],
+        'Площадь комнат, м2': None,
+        'Балкон': _counts(rng, 'Балкон', 'Лоджия', n),
+        'Окна': _choice(rng, ['На улицу', 'Во двор', 'На улицу и двор'], n, missing=0.2),
+        'Санузел': _counts(rng, 'Совмещенный', 'Раздельный', n),
+        'Можно с детьми/животными': _choice(rng, ['Можно с детьми', 'Можно с животными'], n, missing=0.35),
+        'Дополнительно': extras,
+        'Название ЖК': flats['complex'],
+        'Серия дома': None,
+        'Высота потолков, м': np.where(rng.random(n) < 0.5, np.nan, np.round(rng.uniform(2.5, 3.5, n), 2)),
+        'Лифт': _counts(rng, 'Пасс', 'Груз', n),
+        'Мусоропровод': _choice(rng, ['Нет', 'Да'], n, missing=0.7),
+        'Price': np.round(np.exp(rng.normal(11, 0.6, n)), -3).astype(int),
+        'Комнаты': rooms.astype(float),
+        'Площадь_общая': area,
+        'Этаж': floor.astype(float),
+        'Этажность': floors_total,
+        'Метро_станция': 'Арбатская',
+        'Метро_минуты': metro_minutes,
+        'Метро_тип': 'пешком',
+        'lat': flats['lat'],
+        'lon': flats['lon'],
+    })
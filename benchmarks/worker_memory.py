@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.cold_start import LISTING, _status
+from train_and_test.config import BASE_DIR
+
+WORKER_COUNTS = [1, 4, 16]
+
+# How each layout is started; {workers}, {port} and {bundle} are filled in.
+MODES = {
+    "uvicorn_artifacts": ({"SERVING_BUNDLE": ""},
+                          ["-m", "uvicorn", "server.api:app", "--workers", "{workers}", "--port", "{port}"]),
+    "uvicorn_bundle": ({"SERVING_BUNDLE": "{bundle}"},
+                       ["-m", "uvicorn", "server.api:app", "--workers", "{workers}", "--port", "{port}"]),
+    "prefork_bundle": ({"SERVING_BUNDLE": "{bundle}"},
+                       ["-m", "server.serve", "--workers", "{workers}", "--port", "{port}"]),
+}
+
+
+def _descendants(pid: int) -> list:
+    pids = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            for child in f.read().split():
+                pids.append(int(child))
+                pids.extend(_descendants(int(child)))
+    return pids
+
+
+def _memory(pid: int) -> dict:
+    # kB from smaps_rollup: PSS splits every shared page between the
+    # processes mapping it, USS is what the process alone holds.
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {"rss": fields["Rss"], "pss": fields["Pss"],
+            "uss": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def measure(env: dict, args: list, workers: int, port: int, timeout: float = 300) -> dict:
+    base = f"http://127.0.0.1:{port}"
+    body = json.dumps(LISTING).encode()
+    process = subprocess.Popen([sys.executable] + args, cwd=BASE_DIR, env={**os.environ, **env},
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    started = time.perf_counter()
+    try:
+        # Every worker warms its model while starting; wait until the tree
+        # has all of them and its memory stops growing, then score a few
+        # listings so the request path is resident too.
+        previous = None
+        while True:
+            if time.perf_counter() - started > timeout or process.poll() is not None:
+                raise RuntimeError(f"{args} did not settle within {timeout}s")
+            time.sleep(1)
+            # uvicorn runs a single worker in its own process.
+            pids = [process.pid] + _descendants(process.pid)
+            if len(pids) < workers or _status(f"{base}/health/ready") != 200:
+                continue
+            total = sum(_memory(pid)["pss"] for pid in pids)
+            if previous is not None and abs(total - previous) < 1024:
+                break
+            previous = total
+        for _ in range(workers * 10):
+            _status(f"{base}/predict", body)
+        time.sleep(1)
+
+        per_process = {pid: _memory(pid) for pid in [process.pid] + _descendants(process.pid)}
+    finally:
+        process.terminate()
+        process.wait()
+
+    # The largest processes are the workers; the rest are the supervisor
+    # (and multiprocessing's helpers under uvicorn).
+    worker_pids = sorted(per_process, key=lambda pid: per_process[pid]["uss"])[-workers:]
+    total_pss = sum(memory["pss"] for memory in per_process.values())
+    return {
+        "worker_rss_mb": sum(per_process[pid]["rss"] for pid in worker_pids) / workers / 1024,
+        "worker_uss_mb": sum(per_process[pid]["uss"] for pid in worker_pids) / workers / 1024,
+        "total_pss_mb": total_pss / 1024,
+        "pss_per_worker_mb": total_pss / workers / 1024,
+    }
+
+
+def report(bundle: str, worker_counts: list, port: int) -> dict:
+    results = {}
+    for name, (env, args) in MODES.items():
+        for workers in worker_counts:
+            fill = {"workers": workers, "port": port, "bundle": bundle}
+            result = measure({key: value.format(**fill) for key, value in env.items()},
+                             [arg.format(**fill) for arg in args], workers, port)
+            results[f"{name}/{workers}"] = result
+            print(f"{name:<18} workers {workers:>3}  " + "  ".join(f"{key} {value:>7.1f}"
+                                                                 for key, value in result.items()))
+    return results
+
+
+if __name__ == "__main__":
+    from server.bundle import BUNDLE_PATH
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bundle", default=BUNDLE_PATH)
+    parser.add_argument("--workers", type=int, nargs="+", default=WORKER_COUNTS)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    report(args.bundle, args.workers, args.port)
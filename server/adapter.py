@@ -1,87 +1,242 @@
+import hashlib
 import pandas as pd
 import numpy as np
-import joblib
+import math
 import os
+import re
+
+from server.FlatRawInfo import FlatRawInfo
+from server.bundle import SERVING_BUNDLE, open_bundle
+from train_and_test.config import FEATURES
+from train_and_test.geo import CITY_CENTERS, dist_center
 
 
 ARTIFACTS_DIR = os.path.join(os.path.dirname(__file__),"artifacts")
 
-COMBO_FREQ = joblib.load(os.path.join(ARTIFACTS_DIR, "combo_freq.pkl"))
-AREA_THRESHOLD = joblib.load(os.path.join(ARTIFACTS_DIR, "area_threshold.pkl"))
-DIST_CENTER_MEDIAN = joblib.load(os.path.join(ARTIFACTS_DIR, "dist_center_median.pkl"))
+# area_room_combo keys ("64_2") packed as total_area * COMBO_ROOMS_BASE + rooms_count
+# and sorted, so the frequency lookup is a single searchsorted.
+COMBO_ROOMS_BASE = 1000
 
 
-def adapter(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+def _pack_combo(key: str) -> int:
+    area, rooms = key.split('_')
+    return int(area) * COMBO_ROOMS_BASE + int(rooms)
 
-    categorical_cols = ['room_type', 'building_type', 'parking', 'renovation', 'city']
-    for col in categorical_cols:
-        df[col] = df[col].fillna('unknown').astype(str)
 
-    numeric_cols = ['total_area', 'rooms_count', 'lat', 'lon', 'floor', 'floors_total']
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
+def combo_table(combo_freq: dict) -> tuple:
+    items = sorted((_pack_combo(key), count) for key, count in combo_freq.items())
+    return (np.array([key for key, _ in items], dtype=np.int64),
+            np.array([count for _, count in items], dtype=float))
 
-    df['total_area'] = df['total_area'].fillna(60)
-    df['rooms_count'] = df['rooms_count'].fillna(2)
-    df['lat'] = df['lat'].fillna(np.nan)
-    df['lon'] = df['lon'].fillna(np.nan)
-    df['floor'] = df['floor'].fillna(5)
-    df['floors_total'] = df['floors_total'].replace(0, np.nan).fillna(10)
 
-    df['log_area'] = np.log1p(df['total_area'])
-    df['area_sq'] = df['total_area'] ** 2
-    df['flag_big_area'] = (df['total_area'] > AREA_THRESHOLD).astype(int)
+if SERVING_BUNDLE:
+    # The combo table is read in place from the mapped bundle.
+    _bundle = open_bundle(SERVING_BUNDLE)
+    COMBO_KEYS = _bundle.array("combo_keys")
+    COMBO_COUNTS = _bundle.array("combo_counts")
+    AREA_THRESHOLD = _bundle.meta["adapter"]["area_threshold"]
+    DIST_CENTER_MEDIAN = _bundle.meta["adapter"]["dist_center_median"]
+else:
+    import joblib
+    COMBO_KEYS, COMBO_COUNTS = combo_table(joblib.load(os.path.join(ARTIFACTS_DIR, "combo_freq.pkl")))
+    # Plain floats, as in the bundle: adapt_flat() rows must stay JSON-serializable.
+    AREA_THRESHOLD = float(joblib.load(os.path.join(ARTIFACTS_DIR, "area_threshold.pkl")))
+    DIST_CENTER_MEDIAN = float(joblib.load(os.path.join(ARTIFACTS_DIR, "dist_center_median.pkl")))
 
-    df['floor_ratio'] = df['floor'] / df['floors_total']
-    df['floor_ratio'] = df['floor_ratio'].clip(0, 1)
+COMBO_FREQ_BY_KEY = dict(zip(COMBO_KEYS.tolist(), COMBO_COUNTS.tolist()))
 
-    df['area_room_combo'] = (
-        df['total_area'].round().astype(int).astype(str) + '_' +
-        df['rooms_count'].astype(int).astype(str)
-    )
+CATEGORICAL_COLS = ['room_type', 'building_type', 'parking', 'renovation', 'city']
+NUMERIC_COLS = ['total_area', 'rooms_count', 'lat', 'lon', 'floor', 'floors_total']
+
+DEFAULT_TOTAL_AREA = 60
+DEFAULT_ROOMS_COUNT = 2
+DEFAULT_FLOOR = 5
+DEFAULT_FLOORS_TOTAL = 10
+
+EXP_CITY = 'Москва'
+EXP_RENOVATIONS = ['Дизайнерский', 'Евроремонт']
 
-    df['combo_frequency'] = df['area_room_combo'].map(COMBO_FREQ).fillna(0)
-    df['rarity_index'] = 1 / (df['combo_frequency'] + 1)
+LUX_ANCHOR_KEYWORDS = [
+    'двухуровнев', 'двухэтаж', 'панорам',
+    'француз', 'терраса', 'консьерж',
+    'valet', 'лобби', 'residence',
+]
+LUX_ANCHOR_PATTERN = '|'.join(re.escape(k) for k in LUX_ANCHOR_KEYWORDS)
+LUX_ANCHOR_RE = re.compile(LUX_ANCHOR_PATTERN)
 
-    lux_anchor_keywords = [
-        'двухуровнев', 'двухэтаж', 'панорам',
-        'француз', 'терраса', 'консьерж',
-        'valet', 'лобби', 'residence',
-    ]
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURES)}
 
-    df['lux_anchor_flag'] = (
-        df.get('description', '')
+
+def combo_frequency(total_area: np.ndarray, rooms_count: np.ndarray) -> np.ndarray:
+    keys = np.rint(total_area).astype(np.int64) * COMBO_ROOMS_BASE + rooms_count.astype(np.int64)
+    pos = np.minimum(np.searchsorted(COMBO_KEYS, keys), len(COMBO_KEYS) - 1)
+    return np.where(COMBO_KEYS[pos] == keys, COMBO_COUNTS[pos], 0.0)
+
+
+def adapter(df: pd.DataFrame) -> pd.DataFrame:
+    # Builds a new frame with only what scoring reads (FEATURES, plus street
+    # and complex for calibration) instead of copying the request frame.
+    # Floats stay float64 so its rows hash like adapt_flat() rows in the
+    # prediction cache.
+    out = pd.DataFrame(index=df.index)
+
+    for col in CATEGORICAL_COLS:
+        out[col] = df[col].fillna('unknown').astype(str).astype('category')
+
+    numeric = {col: pd.to_numeric(df[col], errors='coerce') for col in NUMERIC_COLS}
+    total_area = numeric['total_area'].fillna(DEFAULT_TOTAL_AREA)
+    rooms_count = numeric['rooms_count'].fillna(DEFAULT_ROOMS_COUNT)
+    floor = numeric['floor'].fillna(DEFAULT_FLOOR)
+    floors_total = numeric['floors_total'].replace(0, np.nan).fillna(DEFAULT_FLOORS_TOTAL)
+
+    out['total_area'] = total_area
+    out['rooms_count'] = rooms_count
+    out['lat'] = numeric['lat']
+    out['lon'] = numeric['lon']
+    out['loggia_count'] = pd.to_numeric(df['loggia_count'], errors='coerce')
+
+    out['log_area'] = np.log1p(total_area)
+    out['area_sq'] = total_area ** 2
+    out['flag_big_area'] = (total_area > AREA_THRESHOLD).astype(np.int8)
+
+    out['floor_ratio'] = (floor / floors_total).clip(0, 1)
+
+    combo_freq = combo_frequency(total_area.to_numpy(), rooms_count.to_numpy())
+    out['rarity_index'] = 1 / (combo_freq + 1)
+
+    out['lux_anchor_flag'] = (
+        df.get('description', pd.Series('', index=df.index))
         .fillna('')
         .str.lower()
-        .apply(lambda x: int(any(k in x for k in lux_anchor_keywords)))
+        .str.contains(LUX_ANCHOR_PATTERN, regex=True)
+        .astype(np.int8)
     )
 
-    is_moscow = (df['city'] == 'Москва').astype(int)
-    good_renovation = df['renovation'].isin(['Дизайнерский', 'Евроремонт']).astype(int)
+    is_moscow = (out['city'] == EXP_CITY).astype(np.int8)
+    good_renovation = out['renovation'].isin(EXP_RENOVATIONS).astype(np.int8)
 
-    df['exp'] = (
-        df['total_area']
+    out['exp'] = (
+        total_area
         * is_moscow
         * good_renovation
-        * df['rarity_index']
+        * out['rarity_index']
     )
 
-    CITY_CENTERS = {
-        'Москва': (55.7558, 37.6173),
-        'Санкт-Петербург': (59.9343, 30.3351),
-        'Свердловская область': (56.8389, 60.6057),
-    }
+    out['dist_center'] = dist_center(out['city'], out['lat'], out['lon'])
+    out['dist_center'] = out['dist_center'].fillna(DIST_CENTER_MEDIAN)
+
+    out['street'] = df['street']
+    out['complex'] = df['complex']
+    return out
+
+
+def _or_nan(value) -> float:
+    return float('nan') if value is None else float(value)
+
+
+# adapt_flat() is split into groups, each tagged with the FlatRawInfo fields
+# it reads, so a stored row can be brought up to date by recomputing only
+# the groups whose inputs changed (update_row). Groups run in this order and
+# later ones read values the earlier ones put in the row.
+
+def _categorical(col: str):
+    index = FEATURE_INDEX[col]
+
+    def compute(flat: FlatRawInfo, row: list):
+        value = getattr(flat, col)
+        row[index] = 'unknown' if value is None else str(value)
+    return compute
+
+
+def _area(flat: FlatRawInfo, row: list):
+    total_area = _or_nan(flat.total_area)
+    if math.isnan(total_area):
+        total_area = float(DEFAULT_TOTAL_AREA)
+    row[FEATURE_INDEX['total_area']] = total_area
+    row[FEATURE_INDEX['log_area']] = float(np.log1p(total_area))
+    row[FEATURE_INDEX['area_sq']] = total_area ** 2
+    row[FEATURE_INDEX['flag_big_area']] = int(total_area > AREA_THRESHOLD)
+
+
+def _rooms(flat: FlatRawInfo, row: list):
+    row[FEATURE_INDEX['rooms_count']] = float(DEFAULT_ROOMS_COUNT if flat.rooms_count is None else flat.rooms_count)
+
+
+def _coordinates(flat: FlatRawInfo, row: list):
+    row[FEATURE_INDEX['lat']] = _or_nan(flat.lat)
+    row[FEATURE_INDEX['lon']] = _or_nan(flat.lon)
+
+
+def _loggia(flat: FlatRawInfo, row: list):
+    row[FEATURE_INDEX['loggia_count']] = _or_nan(flat.loggia_count)
+
+
+def _floor_ratio(flat: FlatRawInfo, row: list):
+    floor = DEFAULT_FLOOR if flat.floor is None else flat.floor
+    floors_total = flat.floors_total or DEFAULT_FLOORS_TOTAL
+    row[FEATURE_INDEX['floor_ratio']] = min(max(floor / floors_total, 0.0), 1.0)
+
+
+def _lux_anchor(flat: FlatRawInfo, row: list):
+    row[FEATURE_INDEX['lux_anchor_flag']] = int(bool(LUX_ANCHOR_RE.search((flat.description or '').lower())))
+
+
+def _rarity(flat: FlatRawInfo, row: list):
+    key = round(row[FEATURE_INDEX['total_area']]) * COMBO_ROOMS_BASE + int(row[FEATURE_INDEX['rooms_count']])
+    row[FEATURE_INDEX['rarity_index']] = 1 / (COMBO_FREQ_BY_KEY.get(key, 0) + 1)
+
+
+def _exp(flat: FlatRawInfo, row: list):
+    is_exp = row[FEATURE_INDEX['city']] == EXP_CITY and row[FEATURE_INDEX['renovation']] in EXP_RENOVATIONS
+    row[FEATURE_INDEX['exp']] = (row[FEATURE_INDEX['total_area']] * row[FEATURE_INDEX['rarity_index']]
+                                 if is_exp else 0.0)
+
+
+def _dist_center(flat: FlatRawInfo, row: list):
+    city = row[FEATURE_INDEX['city']]
+    lat = row[FEATURE_INDEX['lat']]
+    lon = row[FEATURE_INDEX['lon']]
+    if city in CITY_CENTERS and not (math.isnan(lat) or math.isnan(lon)):
+        lat0, lon0 = CITY_CENTERS[city]
+        row[FEATURE_INDEX['dist_center']] = math.sqrt((lat - lat0) ** 2 + (lon - lon0) ** 2)
+    else:
+        row[FEATURE_INDEX['dist_center']] = DIST_CENTER_MEDIAN
+
+
+FEATURE_GROUPS = [((col,), _categorical(col)) for col in CATEGORICAL_COLS] + [
+    (('total_area',), _area),
+    (('rooms_count',), _rooms),
+    (('lat', 'lon'), _coordinates),
+    (('loggia_count',), _loggia),
+    (('floor', 'floors_total'), _floor_ratio),
+    (('description',), _lux_anchor),
+    (('total_area', 'rooms_count'), _rarity),
+    (('total_area', 'rooms_count', 'city', 'renovation'), _exp),
+    (('city', 'lat', 'lon'), _dist_center),
+]
+
+# Identifies the statistics rows are built with: a row stored under another
+# version has to be rebuilt in full.
+FEATURE_VERSION = hashlib.sha256(
+    repr((FEATURES, float(AREA_THRESHOLD), float(DIST_CENTER_MEDIAN))).encode()
+    + COMBO_KEYS.tobytes() + COMBO_COUNTS.tobytes()
+).hexdigest()[:12]
+
 
-    def geo_dist(row):
-        if row['city'] not in CITY_CENTERS:
-            return np.nan
-        lat0, lon0 = CITY_CENTERS[row['city']]
-        if pd.isna(row['lat']) or pd.isna(row['lon']):
-            return np.nan
-        return np.sqrt((row['lat'] - lat0) ** 2 + (row['lon'] - lon0) ** 2)
+def adapt_flat(flat: FlatRawInfo) -> list:
+    # Same features as adapter() for a single validated listing, written
+    # straight into a row in FEATURES order without building a DataFrame.
+    row = [None] * len(FEATURES)
+    for _, compute in FEATURE_GROUPS:
+        compute(flat, row)
+    return row
 
-    df['dist_center'] = df.apply(geo_dist, axis=1)
-    df['dist_center'] = df['dist_center'].fillna(DIST_CENTER_MEDIAN)
 
-    return df
+def update_row(flat: FlatRawInfo, row: list, changed: set) -> list:
+    # A row adapt_flat() built for an earlier version of the listing, brought
+    # up to date for `flat`; `changed` names the FlatRawInfo fields that differ.
+    row = list(row)
+    for inputs, compute in FEATURE_GROUPS:
+        if not changed.isdisjoint(inputs):
+            compute(flat, row)
+    return row
@@ -1,56 +1,552 @@
-from fastapi import FastAPI
-from typing import List, Optional
-import pandas as pd
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from typing import Any, Dict, List, Optional
 import numpy as np
-import joblib
+import orjson
+import pandas as pd
 import os
 import logging
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter, ValidationError
 
 from server.FlatRawInfo import FlatRawInfo
-from server.adapter import adapter
-from train_and_test.postproccesing import calibrate_predictions
-from train_and_test.features_engineering import prepare_data
+from server.adapter import adapter, adapt_flat, ARTIFACTS_DIR
+from server.batcher import MicroBatcher
+from server.bundle import SERVING_BUNDLE, open_bundle
+from server.cache import PredictionCache
+from server.executor import InferenceExecutor, Overloaded
+from server.feature_store import FEATURE_STORE_PATH, FeatureStore, prepared_frame
+from server.metrics import PREDICT_TIER, STAGE_SECONDS, RequestTimingMiddleware, render_metrics
+from server.profiler import SamplingProfiler
+from server.registry import ModelRegistry
+from server.streaming import MAX_LINE_BYTES, NDJSONResponse, ndjson_chunks
+from train_and_test.config import FEATURES, LATENCY_TIERS
+from train_and_test.ensemble import FUSED_DIR, MODEL_PATH, model_version
+from train_and_test.geo import NeighbourIndex
+from train_and_test.postproccesing import calibrate_prediction, calibrate_predictions
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
-
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 class FlatPrediction(BaseModel):
     listing_id: Optional[int]
     predicted_price: Optional[float]
 
-FEATURES = ['total_area', 'renovation', 'parking', 'lat', 'lon', 'building_type', 'room_type', 'rarity_index', 'flag_big_area', 'rooms_count', 'loggia_count', 'floor_ratio', 'city', 'exp', 'dist_center', 'log_area', 'area_sq', 'lux_anchor_flag' ]
+class TieredPrediction(FlatPrediction):
+    tier: str
 
-logger.info("Loading training data...")
-train_df = pd.read_excel(os.path.join(BASE_DIR, "data/raw/train.xlsx"))
-logger.info("Preparing training data...")
-train_df = prepare_data(train_df)
+class FlatError(BaseModel):
+    index: int
+    listing_id: Optional[Any]
+    errors: List[Dict[str, Any]]
+
+class BatchPrediction(BaseModel):
+    predictions: List[FlatPrediction]
+    errors: List[FlatError]
+
+class CacheInfo(BaseModel):
+    size: int
+    max_size: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+
+class BatcherInfo(BaseModel):
+    window_ms: float
+    max_batch_size: int
+    queue_depth: int
+    batches: int
+    items: int
+    mean_batch_size: float
+    batch_sizes: Dict[int, int]
+    mean_queue_wait_ms: float
+    max_queue_wait_ms: float
+
+class ProfilerInfo(BaseModel):
+    running: bool
+    interval_ms: float
+    samples: int
+    stacks: int
+    started_at: Optional[float]
+    stopped_at: Optional[float]
+
+class ExecutorInfo(BaseModel):
+    workers: int
+    max_queue: int
+    queued: int
+    running: int
+    completed: int
+    rejected: Dict[str, int]
+
+class FeatureStoreInfo(BaseModel):
+    path: str
+    size: int
+    feature_version: str
+    unchanged: int
+    updated: int
+    created: int
+
+class HealthInfo(BaseModel):
+    status: str
+    model_version: Optional[str] = None
+    detail: Optional[str] = None
+
+class ModelInfo(BaseModel):
+    version: str
+    path: str
+    n_models: int
+    loaded_at: float
+    load_seconds: float
+    tier_latency_ms: Dict[str, float]
+
+if SERVING_BUNDLE:
+    bundle_meta = open_bundle(SERVING_BUNDLE).meta
+    calibration = bundle_meta["calibration"]
+    calibration_version = bundle_meta["calibration_version"]
+else:
+    import io
+    import joblib
+    with open(os.path.join(ARTIFACTS_DIR, "calibration.pkl"), "rb") as f:
+        calibration_payload = f.read()
+    calibration = joblib.load(io.BytesIO(calibration_payload))
+    calibration_version = model_version(calibration_payload)
+
+# Moscow listings without a street median blend towards the median price of
+# their nearest training listings instead of the global median.
+NEIGHBOUR_FALLBACK = os.environ.get("CALIBRATION_NEIGHBOUR_FALLBACK", "0") == "1"
+if not NEIGHBOUR_FALLBACK:
+    neighbours = None
+elif SERVING_BUNDLE:
+    neighbours = open_bundle(SERVING_BUNDLE).neighbours()
+else:
+    neighbours = NeighbourIndex.load(os.path.join(ARTIFACTS_DIR, "neighbours.npz"))
+
+prediction_cache = PredictionCache(
+    max_size=int(os.environ.get("PREDICTION_CACHE_SIZE", 100_000)),
+    ttl_seconds=float(os.environ.get("PREDICTION_CACHE_TTL", 3600)),
+)
+
+# Listings scored through /predict keep their feature rows here, so a
+# rescore of an edited listing recomputes only what its edit touched.
+feature_store = FeatureStore(FEATURE_STORE_PATH) if FEATURE_STORE_PATH else None
+
+registry = ModelRegistry(
+    MODEL_PATH,
+    FUSED_DIR,
+    warmup_rows=[adapt_flat(FlatRawInfo(listing_id=0))],
+    bundle_path=SERVING_BUNDLE,
+)
+model_load_error: Optional[str] = None
+
+# Logging every raw prediction costs more than scoring a cached row; it is
+# for debugging only.
+LOG_PREDICTIONS = os.environ.get("LOG_PREDICTIONS", "0") == "1"
+
+# The /debug/profiler routes exist only with ENABLE_PROFILER=1: they expose
+# stack dumps of the process to anyone who can reach the API.
+ENABLE_PROFILER = os.environ.get("ENABLE_PROFILER", "0") == "1"
+
+BATCH_WINDOW_MS = float(os.environ.get("PREDICT_BATCH_WINDOW_MS", 0))
+BATCH_MAX_SIZE = int(os.environ.get("PREDICT_BATCH_MAX_SIZE", 64))
+
+# Scoring runs on its own bounded pool rather than the shared threadpool, so
+# a traffic spike is shed with 503 instead of queueing without limit.
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", os.cpu_count() or 1))
+INFERENCE_MAX_QUEUE = int(os.environ.get("INFERENCE_MAX_QUEUE", 64))
+INFERENCE_RETRY_AFTER = os.environ.get("INFERENCE_RETRY_AFTER", "1")
+# Default time budget for a request, overridden per request by the
+# X-Request-Timeout-Ms header; 0 means no deadline.
+PREDICT_TIMEOUT_MS = float(os.environ.get("PREDICT_TIMEOUT_MS", 0))
+
+# Listings scored per call by /predict/stream.
+PREDICT_STREAM_CHUNK_SIZE = int(os.environ.get("PREDICT_STREAM_CHUNK_SIZE", 1000))
+
+inference = InferenceExecutor(INFERENCE_WORKERS, INFERENCE_MAX_QUEUE)
+
+
+async def infer(fn, *args, deadline: Optional[float] = None):
+    return await asyncio.wrap_future(inference.submit(fn, *args, deadline=deadline))
+
+
+def request_deadline(timeout_ms: Optional[float]) -> Optional[float]:
+    timeout_ms = PREDICT_TIMEOUT_MS if timeout_ms is None else timeout_ms
+    return time.monotonic() + timeout_ms / 1000 if timeout_ms > 0 else None
+
+
+def score_flats(flats: List[FlatRawInfo]) -> List[float]:
+    if len(flats) == 1:
+        return [score_flat(flats[0])]
+    if feature_store is not None:
+        with STAGE_SECONDS.time("adapter"):
+            df_prepared = prepared_frame([feature_store.features(flat) for flat in flats],
+                                         [{'street': flat.street, 'complex': flat.complex} for flat in flats])
+        return [float(price) for price in score_prepared(df_prepared)]
+    df = pd.DataFrame([flat.model_dump() for flat in flats])
+    return [float(price) for price in score(df)]
+
+
+# With a zero window every /predict call is scored on its own.
+batcher = (MicroBatcher(score_flats, BATCH_WINDOW_MS, BATCH_MAX_SIZE,
+                        run=infer, max_queue=BATCH_MAX_SIZE * INFERENCE_MAX_QUEUE,
+                        reject=inference.reject)
+           if BATCH_WINDOW_MS > 0 else None)
+
+
+def load_model():
+    global model_load_error
+    try:
+        registry.load()
+    except Exception as e:
+        logger.exception("Model load failed")
+        model_load_error = str(e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The model loads in the background: /health/live answers as soon as the
+    # process is up, /health/ready and the scoring endpoints once it is warm.
+    app.state.model_loading = asyncio.create_task(run_in_threadpool(load_model))
+    if batcher is not None:
+        batcher.start()
+    yield
+    if batcher is not None:
+        await batcher.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestTimingMiddleware)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, e: Overloaded):
+    return JSONResponse({"detail": f"Service overloaded: {e.reason}"}, status_code=503,
+                        headers={"Retry-After": INFERENCE_RETRY_AFTER})
+
+PREDICTIONS_JSON = TypeAdapter(List[TieredPrediction])
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+if ENABLE_PROFILER:
+    profiler = SamplingProfiler()
+
+    @app.get("/debug/profiler", response_model=ProfilerInfo)
+    def get_profiler():
+        return ProfilerInfo(**profiler.stats())
+
+    @app.post("/debug/profiler/start", response_model=ProfilerInfo)
+    def start_profiler(interval_ms: float = 10):
+        profiler.start(interval_ms)
+        return ProfilerInfo(**profiler.stats())
+
+    @app.post("/debug/profiler/stop")
+    def stop_profiler():
+        # Collapsed stacks, ready for flamegraph.pl or speedscope.
+        profiler.stop()
+        return Response(profiler.collapsed(), media_type="text/plain")
+
+
+def active_model():
+    if not registry.ready:
+        raise HTTPException(status_code=503, detail="Model is loading", headers={"Retry-After": "1"})
+    return registry.current
+
+
+@app.get("/health/live", response_model=HealthInfo)
+def liveness():
+    return HealthInfo(status="alive")
 
-@app.post("/predict", response_model=List[FlatPrediction])
-def predict(flat: FlatRawInfo):
-    listing_id = flat.listing_id
 
-    df = pd.DataFrame([flat.model_dump()])
-    df_prepared = adapter(df)
+@app.get("/health/ready", response_model=HealthInfo)
+def readiness():
+    if registry.ready:
+        return HealthInfo(status="ready", model_version=registry.current.version)
+    status = "failed" if model_load_error is not None else "loading"
+    return Response(HealthInfo(status=status, detail=model_load_error).model_dump_json(),
+                    status_code=503, media_type="application/json")
 
-    model_path = os.path.join(BASE_DIR, "model", "catboost_model.pkl")
-    models = joblib.load(model_path)
 
-    prediction = df_prepared[FEATURES]
-    raw_prediction = np.zeros(len(prediction))
-    for model in models:
-        raw_prediction += np.expm1(model.predict(prediction)) / len(models)
-    logger.info(f"raw: {raw_prediction}")
+def model_info() -> ModelInfo:
+    loaded = active_model()
+    return ModelInfo(version=loaded.version,
+                     path=loaded.path,
+                     n_models=loaded.ensemble.n_models,
+                     loaded_at=loaded.loaded_at,
+                     load_seconds=loaded.load_seconds,
+                     tier_latency_ms=loaded.tier_latency_ms)
 
+
+@app.get("/model", response_model=ModelInfo)
+def get_model():
+    return model_info()
+
+
+@app.post("/model/reload", response_model=ModelInfo)
+def reload_model():
+    previous_version = registry.current.version if registry.ready else None
+    try:
+        loaded = registry.load()
+    except Exception as e:
+        logger.exception("Model reload failed, keeping the active model")
+        raise HTTPException(status_code=500, detail=f"Model reload failed: {e}")
+    if loaded.version != previous_version:
+        prediction_cache.invalidate()
+    return model_info()
+
+
+@app.get("/executor", response_model=ExecutorInfo)
+def get_executor():
+    return ExecutorInfo(**inference.stats())
+
+
+@app.get("/feature-store", response_model=Optional[FeatureStoreInfo])
+def get_feature_store():
+    return FeatureStoreInfo(**feature_store.stats()) if feature_store is not None else None
+
+
+@app.get("/cache", response_model=CacheInfo)
+def get_cache():
+    return CacheInfo(**prediction_cache.stats())
+
+
+@app.delete("/cache", response_model=CacheInfo)
+def clear_cache():
+    prediction_cache.invalidate()
+    return CacheInfo(**prediction_cache.stats())
+
+
+def predict_raw(X, tier: str = "full") -> np.ndarray:
+    # Cached on the model input, so listings that differ only in fields the
+    # model never sees (street, description wording) share an entry.
+    loaded = registry.current
+
+    def forward(rows):
+        with STAGE_SECONDS.time("model"):
+            return loaded.predict(rows, tier)
+
+    namespace = f"{loaded.version}:{calibration_version}"
+    if tier != "full":
+        namespace += f":{tier}"
+    return prediction_cache.predict(X, namespace, forward)
+
+
+def neighbour_median(df_prepared: pd.DataFrame) -> Optional[np.ndarray]:
+    if neighbours is None:
+        return None
+    # Only listings that reach the street blend need the lookup.
+    needed = ((df_prepared['city'] == 'Москва')
+              & ~df_prepared['street'].isin(list(calibration['street_median'].keys()))).to_numpy()
+    median = np.full(len(df_prepared), np.nan)
+    if needed.any():
+        with STAGE_SECONDS.time("neighbours"):
+            median[needed] = neighbours.knn_median(df_prepared['lat'][needed], df_prepared['lon'][needed])
+    return median
+
+
+def neighbour_median_one(flat: FlatRawInfo) -> Optional[float]:
+    if neighbours is None or flat.city != 'Москва' or flat.street in calibration['street_median']:
+        return None
+    with STAGE_SECONDS.time("neighbours"):
+        return neighbours.knn_median_one(flat.lat, flat.lon)
+
+
+def score(df: pd.DataFrame) -> np.ndarray:
+    with STAGE_SECONDS.time("adapter"):
+        df_prepared = adapter(df)
+    return score_prepared(df_prepared)
+
+
+def score_prepared(df_prepared: pd.DataFrame) -> np.ndarray:
+    # df_prepared holds FEATURES plus street and complex for calibration.
+    raw_prediction = predict_raw(df_prepared[FEATURES])
+    if LOG_PREDICTIONS:
+        logger.info(f"raw: {raw_prediction}")
+
+    timings = {}
     final_prediction = calibrate_predictions(raw_prediction,
-                                             train_df,
-                                             df_prepared)
+                                             calibration,
+                                             df_prepared,
+                                             timings=timings,
+                                             neighbour_median=neighbour_median(df_prepared))
+    STAGE_SECONDS.observe_all(timings)
+    return final_prediction
+
+
+def score_flat(flat: FlatRawInfo, tier: str = "full") -> float:
+    with STAGE_SECONDS.time("adapter"):
+        row = feature_store.features(flat) if feature_store is not None else adapt_flat(flat)
+
+    raw_prediction = predict_raw([row], tier)
+    if LOG_PREDICTIONS:
+        logger.info(f"raw: {raw_prediction}")
+
+    timings = {}
+    final_prediction = calibrate_prediction(float(raw_prediction[0]),
+                                            calibration,
+                                            flat.city,
+                                            flat.street,
+                                            flat.complex,
+                                            timings=timings,
+                                            neighbour_median=neighbour_median_one(flat))
+    STAGE_SECONDS.observe_all(timings)
+    return final_prediction
+
+
+def choose_tier(tier: Optional[str], deadline: Optional[float]) -> str:
+    # An explicit tier wins; otherwise the time left before the deadline
+    # picks the most accurate tier the warmup measured to fit it.
+    if tier is not None:
+        if tier not in LATENCY_TIERS:
+            raise HTTPException(status_code=422, detail=f"Unknown tier {tier!r}, expected one of {list(LATENCY_TIERS)}")
+        return tier
+    if deadline is None:
+        return "full"
+    return registry.current.tier_for((deadline - time.monotonic()) * 1000)
+
+
+@app.post("/predict", response_model=List[TieredPrediction])
+async def predict(flat: FlatRawInfo, tier: Optional[str] = None,
+                  x_request_timeout_ms: Optional[float] = Header(None)):
+    active_model()
+    listing_id = flat.listing_id
+    deadline = request_deadline(x_request_timeout_ms)
+    tier = choose_tier(tier, deadline)
+
+    # Reduced tiers skip the micro-batcher: waiting for a batch would cost
+    # more than they save.
+    if batcher is None or tier != "full":
+        final_prediction = await infer(score_flat, flat, tier, deadline=deadline)
+    else:
+        inference.check_deadline(deadline)
+        try:
+            final_prediction = await batcher.submit(flat, deadline)
+        except asyncio.QueueFull:
+            inference.reject("queue_full")
+    # Counted once scored: calls shed with 503 were not served by a tier.
+    PREDICT_TIER.inc(tier)
+
+    prediction = TieredPrediction(listing_id=listing_id, predicted_price=final_prediction, tier=tier)
+
+    with STAGE_SECONDS.time("serialization"):
+        return Response(PREDICTIONS_JSON.dump_json([prediction]), media_type="application/json")
+
+
+@app.get("/predict/batcher", response_model=Optional[BatcherInfo])
+def get_batcher():
+    return BatcherInfo(**batcher.stats()) if batcher is not None else None
+
+
+def score_batch(items: List[Any]) -> bytes:
+    # Validation, scoring and serialization all run on the inference pool.
+    flats, errors = [], []
+    with STAGE_SECONDS.time("validation"):
+        for index, item in enumerate(items):
+            try:
+                flats.append(FlatRawInfo.model_validate(item))
+            except ValidationError as e:
+                errors.append(FlatError(index=index,
+                                        listing_id=item.get('listing_id') if isinstance(item, dict) else None,
+                                        errors=e.errors(include_url=False, include_context=False)))
+
+    final_prediction = score(pd.DataFrame([flat.model_dump() for flat in flats])) if flats else []
+
+    with STAGE_SECONDS.time("serialization"):
+        predictions = [
+            FlatPrediction(listing_id=flat.listing_id, predicted_price=float(price))
+            for flat, price in zip(flats, final_prediction)
+        ]
+        return BatchPrediction(predictions=predictions, errors=errors).model_dump_json().encode()
+
+
+@app.post("/predict/batch", response_model=BatchPrediction)
+async def predict_batch(items: List[Any], x_request_timeout_ms: Optional[float] = Header(None)):
+    # Async, so a waiting batch holds a slot of the bounded inference queue
+    # rather than a threadpool token: overload is shed with 503.
+    deadline = request_deadline(x_request_timeout_ms)
+    active_model()
+    body = await infer(score_batch, items, deadline=deadline)
+    return Response(body, media_type="application/json")
+
+
+def score_stream_chunk(lines: list, first_index: int) -> bytes:
+    # Validation, scoring and serialization of a whole chunk run on the
+    # inference pool; the event loop only splits the body into lines.
+    entries, flats = [], []
+    with STAGE_SECONDS.time("validation"):
+        for index, line in enumerate(lines, first_index):
+            item = None
+            if line is None:
+                errors = [{"type": "line_too_long", "msg": f"Line longer than {MAX_LINE_BYTES} bytes"}]
+            else:
+                try:
+                    item = orjson.loads(line)
+                    flat = FlatRawInfo.model_validate(item)
+                except orjson.JSONDecodeError as e:
+                    errors = [{"type": "json_invalid", "msg": str(e)}]
+                except ValidationError as e:
+                    errors = e.errors(include_url=False, include_context=False)
+                else:
+                    flats.append(flat)
+                    entries.append(flat)
+                    continue
+            entries.append({"index": index,
+                            "listing_id": item.get('listing_id') if isinstance(item, dict) else None,
+                            "errors": errors})
+
+    prices = iter(score(pd.DataFrame([flat.model_dump() for flat in flats])) if flats else ())
+
+    with STAGE_SECONDS.time("serialization"):
+        out = []
+        for entry in entries:
+            if isinstance(entry, FlatRawInfo):
+                entry = {"listing_id": entry.listing_id, "predicted_price": float(next(prices))}
+            out.append(orjson.dumps(entry))
+        out.append(b"")
+        return b"\n".join(out)
+
+
+@app.post("/predict/stream", response_class=NDJSONResponse)
+async def predict_stream(request: Request, x_request_timeout_ms: Optional[float] = Header(None)):
+    # Newline-delimited FlatRawInfo in, one line per listing out, in input
+    # order: a FlatPrediction, or a FlatError for a line that fails to parse
+    # or validate. The body is read and scored chunk by chunk, so memory
+    # does not grow with the upload.
+    active_model()
+    chunks = ndjson_chunks(request.stream(), PREDICT_STREAM_CHUNK_SIZE)
 
-    prediction = FlatPrediction(listing_id=listing_id, predicted_price=float(final_prediction[0]))
+    # The first chunk is scored before the response starts, so an overloaded
+    # server still answers 503; the deadline applies to it alone.
+    first = await anext(chunks, None)
+    if first is None:
+        return NDJSONResponse(iter(()))
+    head = await infer(score_stream_chunk, first, 0, deadline=request_deadline(x_request_timeout_ms))
 
-    return [prediction]
+    async def results():
+        yield head
+        index = len(first)
+        try:
+            async for lines in chunks:
+                while True:
+                    try:
+                        body = await infer(score_stream_chunk, lines, index)
+                        break
+                    except Overloaded:
+                        # The stream is already admitted: wait for room
+                        # rather than cut it off.
+                        await asyncio.sleep(float(INFERENCE_RETRY_AFTER))
+                index += len(lines)
+                yield body
+        except ClientDisconnect:
+            logger.info(f"Stream client disconnected after {index} listings")
 
+    return NDJSONResponse(results())
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+async def _run_in_threadpool(fn: Callable, *args, deadline: Optional[float] = None):
+    return await run_in_threadpool(fn, *args)
+
+
+def _expired(reason: str):
+    raise asyncio.TimeoutError(reason)
+
+
+class MicroBatcher:
+    def __init__(self, handler: Callable[[list], list], window_ms: float, max_batch_size: int,
+                 run: Callable[..., Awaitable] = _run_in_threadpool, max_queue: int = 0,
+                 reject: Callable[[str], None] = _expired):
+        # run(fn, entries, deadline=...) executes a batch off the event loop;
+        # with max_queue set, submit raises asyncio.QueueFull past that many
+        # waiting items. An item whose deadline (a time.monotonic() value)
+        # passes before its batch runs is not scored: its caller gets the
+        # exception reject("deadline") raises.
+        self.handler = handler
+        self.run = run
+        self.reject = reject
+        self.max_queue = max_queue
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight = set()
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = {}
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._in_flight):
+            task.cancel()
+
+    async def submit(self, item, deadline: Optional[float] = None):
+        if self._worker is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, time.perf_counter(), deadline))
+        return await future
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _expire(self, future: asyncio.Future):
+        try:
+            self.reject("deadline")
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+
+    def _handle_live(self, entries: list) -> tuple:
+        # Runs off the event loop, once the batch gets a worker: items whose
+        # deadline passed while it waited are left out.
+        now = time.monotonic()
+        live = [i for i, (_, deadline) in enumerate(entries) if deadline is None or now < deadline]
+        return live, (self.handler([entries[i][0] for i in live]) if live else [])
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            self._record(len(batch), [started - enqueued for _, _, enqueued, _ in batch])
+            now = time.monotonic()
+            pending = []
+            for entry in batch:
+                deadline = entry[3]
+                if deadline is not None and now >= deadline:
+                    self._expire(entry[1])
+                else:
+                    pending.append(entry)
+            if pending:
+                # Batches run concurrently, up to what run() admits (the
+                # inference executor sheds the rest), while the next one
+                # is collected.
+                task = asyncio.create_task(self._dispatch(pending))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch: list):
+        # The batch may wait for a worker until its last deadline.
+        deadlines = [deadline for _, _, _, deadline in batch]
+        deadline = None if None in deadlines else max(deadlines)
+        try:
+            live, results = await self.run(self._handle_live, [(item, deadline) for item, _, _, deadline in batch],
+                                           deadline=deadline)
+        except Exception as e:
+            logger.exception(f"Batch of {len(batch)} failed")
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        scored = dict(zip(live, results))
+        for i, (_, future, _, _) in enumerate(batch):
+            if i not in scored:
+                self._expire(future)
+            elif not future.done():
+                future.set_result(scored[i])
+
+    def _record(self, size: int, waits: list):
+        self.batches += 1
+        self.items += size
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+        self.queue_wait_total += sum(waits)
+        self.queue_wait_max = max(self.queue_wait_max, max(waits))
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batch_sizes": self.batch_sizes,
+            "mean_queue_wait_ms": self.queue_wait_total / self.items * 1000 if self.items else 0.0,
+            "max_queue_wait_ms": self.queue_wait_max * 1000,
+        }
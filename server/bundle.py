@@ -0,0 +1,209 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from train_and_test.config import BASE_DIR, FEATURES
+
+logger = logging.getLogger(__name__)
+
+# Everything the server needs to score, precompiled into one file that every
+# worker memory-maps read-only, so N workers share one copy of the pages in
+# the page cache. Layout:
+#
+#   magic (8) | format version (u32) | header length (u32) | sha256 (32)
+#   JSON header: versions, adapter constants, calibration tables, fused
+#                ensemble meta and the offset/dtype/shape of every section
+#   sections, each aligned to SECTION_ALIGN: the fused model (.cbm bytes),
+#                leaf values/offsets, combo frequency table, neighbour index
+#
+# The checksum covers everything after the fixed prefix; the bundle version
+# is its first 12 hex digits.
+BUNDLE_PATH = os.path.join(BASE_DIR, "model", "serving.bundle")
+BUNDLE_MAGIC = b"RPBUNDLE"
+BUNDLE_FORMAT = 1
+SECTION_ALIGN = 4096
+_PREFIX = struct.Struct("<8sII32s")
+
+TABLE_SECTIONS = ["combo_keys", "combo_counts", "neighbour_lat", "neighbour_lon", "neighbour_price"]
+
+# Set to a bundle file to start the server from it.
+SERVING_BUNDLE = os.environ.get("SERVING_BUNDLE") or None
+
+
+class ServingBundle:
+    def __init__(self, path: str, verify: bool = True):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, header_length, checksum = _PREFIX.unpack_from(self._mmap)
+        if magic != BUNDLE_MAGIC or fmt != BUNDLE_FORMAT:
+            raise ValueError(f"{path} is not a serving bundle of format {BUNDLE_FORMAT}, rebuild it")
+        if verify and hashlib.sha256(memoryview(self._mmap)[_PREFIX.size:]).digest() != checksum:
+            raise ValueError(f"Serving bundle {path} is corrupt: checksum mismatch")
+        header = json.loads(self._mmap[_PREFIX.size:_PREFIX.size + header_length])
+        self.version = checksum.hex()[:12]
+        self.meta = header["meta"]
+        self.sections = header["sections"]
+        if self.meta["features"] != FEATURES:
+            raise ValueError(f"Serving bundle {path} was built for different FEATURES, rebuild it")
+
+    def array(self, name: str) -> np.ndarray:
+        # Read-only view straight into the mapping: no copy, pages shared
+        # with every other process mapping the same file.
+        section = self.sections[name]
+        return np.frombuffer(self._mmap, dtype=section["dtype"], count=int(np.prod(section["shape"])),
+                             offset=section["offset"]).reshape(section["shape"])
+
+    def blob(self, name: str) -> memoryview:
+        section = self.sections[name]
+        return memoryview(self._mmap)[section["offset"]:section["offset"] + section["length"]]
+
+    def tables_version(self) -> str:
+        # Everything but the model: adapter constants, calibration and the
+        # combo and neighbour tables, which the API reads once per process.
+        digest = hashlib.sha256(json.dumps([self.meta["adapter"], self.meta["calibration"],
+                                            self.meta["calibration_version"]], sort_keys=True).encode())
+        for name in TABLE_SECTIONS:
+            digest.update(self.blob(name))
+        return digest.hexdigest()[:12]
+
+    def ensemble(self):
+        from catboost import CatBoost
+        from train_and_test.ensemble import FusedEnsemble
+
+        # catboost can only deserialize a model into its own memory; the
+        # leaf arrays the fast path reads stay in the mapping.
+        model = CatBoost()
+        model.load_model(blob=bytes(self.blob("model")))
+        fused = self.meta["fused"]
+        return FusedEnsemble(model, self.array("leaf_values"), self.array("leaf_offsets"),
+                             fused["tree_counts"], fused["scales"], fused["biases"])
+
+    def neighbours(self):
+        from train_and_test.geo import NeighbourIndex
+        return NeighbourIndex(self.array("neighbour_lat"), self.array("neighbour_lon"),
+                              self.array("neighbour_price"))
+
+
+@lru_cache(maxsize=None)
+def open_bundle(path: str) -> ServingBundle:
+    # One mapping per process for the adapter and calibration tables; the
+    # registry opens its own on every load so a rebuilt file is picked up.
+    return ServingBundle(path)
+
+
+def _write_bundle(path: str, meta: dict, sections: dict):
+    header = {"meta": meta, "sections": {}}
+    # Offsets depend on the header length, which depends on the offsets:
+    # reserve a generous width for them and pad the header to it.
+    payloads = {}
+    for name, value in sections.items():
+        if isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            header["sections"][name] = {"offset": 0, "length": value.nbytes,
+                                        "dtype": value.dtype.str, "shape": list(value.shape)}
+            payloads[name] = value.tobytes()
+        else:
+            header["sections"][name] = {"offset": 0, "length": len(value)}
+            payloads[name] = bytes(value)
+    for section in header["sections"].values():
+        section["offset"] = 10 ** 12
+    header_length = len(json.dumps(header, ensure_ascii=False).encode())
+
+    position = -(-(_PREFIX.size + header_length) // SECTION_ALIGN) * SECTION_ALIGN
+    for name, section in header["sections"].items():
+        section["offset"] = position
+        position = -(-(position + section["length"]) // SECTION_ALIGN) * SECTION_ALIGN
+    header_bytes = json.dumps(header, ensure_ascii=False).encode().ljust(header_length)
+
+    body = bytearray(position - _PREFIX.size)
+    body[:header_length] = header_bytes
+    for name, section in header["sections"].items():
+        start = section["offset"] - _PREFIX.size
+        body[start:start + section["length"]] = payloads[name]
+    checksum = hashlib.sha256(body).digest()
+
+    # Replaced atomically: workers still mapping the old file keep its inode.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(BUNDLE_MAGIC, BUNDLE_FORMAT, header_length, checksum))
+        f.write(body)
+    os.replace(tmp_path, path)
+    return checksum.hex()[:12]
+
+
+def build_bundle(path: str = BUNDLE_PATH) -> dict:
+    import io
+    import tempfile
+    import joblib
+    from server.adapter import combo_table
+    from train_and_test.ensemble import MODEL_PATH, FusedEnsemble, model_version
+    from train_and_test.geo import NeighbourIndex
+
+    with open(MODEL_PATH, "rb") as f:
+        payload = f.read()
+    version = model_version(payload)
+    logger.info(f"Building serving bundle for model {version} in {path}...")
+    # Fused from the source models: re-saving a model loaded from
+    # model/fused would not round-trip its training params.
+    fused = FusedEnsemble.from_models(joblib.load(io.BytesIO(payload)))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fused.model.save_model(os.path.join(tmp_dir, "model.cbm"))
+        with open(os.path.join(tmp_dir, "model.cbm"), "rb") as f:
+            model_bytes = f.read()
+
+    artifacts_dir = os.path.join(BASE_DIR, "server", "artifacts")
+    with open(os.path.join(artifacts_dir, "calibration.pkl"), "rb") as f:
+        calibration_payload = f.read()
+    calibration = joblib.load(io.BytesIO(calibration_payload))
+    neighbours = NeighbourIndex.load(os.path.join(artifacts_dir, "neighbours.npz"))
+
+    combo_keys, combo_counts = combo_table(joblib.load(os.path.join(artifacts_dir, "combo_freq.pkl")))
+
+    meta = {
+        "model_version": version,
+        "calibration_version": model_version(calibration_payload),
+        "built_at": time.time(),
+        "features": FEATURES,
+        "adapter": {
+            "area_threshold": float(joblib.load(os.path.join(artifacts_dir, "area_threshold.pkl"))),
+            "dist_center_median": float(joblib.load(os.path.join(artifacts_dir, "dist_center_median.pkl"))),
+        },
+        "calibration": {
+            "street_median": {street: float(price) for street, price in calibration['street_median'].items()},
+            "global_median": float(calibration['global_median']),
+            "expensive_threshold": float(calibration['expensive_threshold']),
+            "complex_median": {name: float(price) for name, price in calibration['complex_median'].items()},
+            "complex_factor": float(calibration['complex_factor']),
+            "complex_median_increase": float(calibration['complex_median_increase']),
+        },
+        "fused": {
+            "tree_counts": fused.tree_counts.tolist(),
+            "scales": fused.scales.tolist(),
+            "biases": fused.biases.tolist(),
+        },
+    }
+    bundle_version = _write_bundle(path, meta, {
+        "model": model_bytes,
+        "leaf_values": np.asarray(fused.leaf_values, dtype=float),
+        "leaf_offsets": np.asarray(fused.leaf_offsets, dtype=np.int64),
+        "combo_keys": combo_keys,
+        "combo_counts": combo_counts,
+        "neighbour_lat": neighbours.lat,
+        "neighbour_lon": neighbours.lon,
+        "neighbour_price": neighbours.price,
+    })
+    logger.info(f"Serving bundle {bundle_version} (model {version}) ready")
+    return meta
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build_bundle()
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+
+
+def canonical_row(row: list) -> list:
+    # Rows built by adapt_flat() and rows sliced from adapter() output must
+    # hash the same: numbers (ints, numpy scalars, None) become floats.
+    return [value if isinstance(value, str) else float('nan' if value is None else value)
+            for value in row]
+
+
+class PredictionCache:
+    def __init__(self, max_size: int = 100_000, ttl_seconds: float = 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(row: list, namespace: str) -> bytes:
+        payload = json.dumps([namespace, canonical_row(row)], ensure_ascii=False)
+        return hashlib.blake2b(payload.encode(), digest_size=16).digest()
+
+    def get(self, key: bytes):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: bytes, value: float):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._items.clear()
+
+    def predict(self, X, namespace: str, predict: Callable) -> np.ndarray:
+        rows = X if isinstance(X, list) else X.to_numpy(dtype=object).tolist()
+        keys = [self.key(row, namespace) for row in rows]
+
+        raw_prediction = np.empty(len(rows))
+        missing = []
+        for i, key in enumerate(keys):
+            value = self.get(key)
+            if value is None:
+                missing.append(i)
+            else:
+                raw_prediction[i] = value
+
+        if missing:
+            if isinstance(X, list):
+                raw_prediction[missing] = predict([rows[i] for i in missing])
+            else:
+                raw_prediction[missing] = predict(X.iloc[missing])
+            for i in missing:
+                self.put(keys[i], float(raw_prediction[i]))
+        return raw_prediction
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,97 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from server.metrics import INFERENCE_QUEUE, INFERENCE_REJECTED, STAGE_SECONDS
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class InferenceExecutor:
+    # Bounded front for scoring: at most `workers` calls run at once and at
+    # most `max_queue` wait behind them. Past that a call is rejected up
+    # front instead of queueing without limit, and a call whose deadline
+    # passes while it waits is dropped before it runs.
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = {"queue_full": 0, "deadline": 0}
+        for reason in self.rejected:
+            INFERENCE_REJECTED.inc(reason, 0)
+        self._publish()
+
+    def reject(self, reason: str):
+        with self._lock:
+            self.rejected[reason] += 1
+        INFERENCE_REJECTED.inc(reason)
+        raise Overloaded(reason)
+
+    def _publish(self):
+        INFERENCE_QUEUE.set("queued", self.queued)
+        INFERENCE_QUEUE.set("running", self.running)
+
+    def check_deadline(self, deadline: Optional[float]):
+        # deadline is a time.monotonic() value.
+        if deadline is not None and time.monotonic() >= deadline:
+            self.reject("deadline")
+
+    def submit(self, fn: Callable, *args, deadline: Optional[float] = None) -> Future:
+        self.check_deadline(deadline)
+        with self._lock:
+            full = self.queued >= self.max_queue
+            if not full:
+                self.queued += 1
+                self._publish()
+        if full:
+            self.reject("queue_full")
+        future = self._pool.submit(self._run, fn, args, deadline, time.perf_counter())
+        future.add_done_callback(self._release_cancelled)
+        return future
+
+    def _release_cancelled(self, future: Future):
+        # A call cancelled while queued (asyncio.wrap_future passes a
+        # request's cancellation on) never reaches _run, which is what
+        # frees its queue slot otherwise.
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+                self._publish()
+
+    def _run(self, fn: Callable, args: tuple, deadline: Optional[float], enqueued: float):
+        with self._lock:
+            self.queued -= 1
+            expired = deadline is not None and time.monotonic() >= deadline
+            if not expired:
+                self.running += 1
+            self._publish()
+        STAGE_SECONDS.observe("queue", time.perf_counter() - enqueued)
+        if expired:
+            self.reject("deadline")
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self._publish()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": dict(self.rejected),
+            }
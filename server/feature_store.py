@@ -0,0 +1,229 @@
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import orjson
+import pandas as pd
+
+from server.FlatRawInfo import FlatRawInfo
+from server.adapter import FEATURE_VERSION, adapt_flat, adapter, update_row
+from train_and_test.config import FEATURES
+
+logger = logging.getLogger(__name__)
+
+# Set to a SQLite file to keep every scored listing's feature row.
+FEATURE_STORE_PATH = os.environ.get("FEATURE_STORE_PATH") or None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    listing_id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    raw TEXT NOT NULL,
+    features TEXT NOT NULL,
+    feature_version TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    predicted_price REAL,
+    model_version TEXT,
+    scored_at REAL
+)
+"""
+
+UPSERT = """
+INSERT INTO listings (listing_id, content_hash, raw, features, feature_version, updated_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (listing_id) DO UPDATE SET
+    content_hash = excluded.content_hash,
+    raw = excluded.raw,
+    features = excluded.features,
+    feature_version = excluded.feature_version,
+    updated_at = excluded.updated_at,
+    predicted_price = NULL,
+    model_version = NULL,
+    scored_at = NULL
+"""
+
+
+def content_hash(raw_json: bytes) -> str:
+    return hashlib.blake2b(raw_json, digest_size=16).hexdigest()
+
+
+def dump_row(row: list) -> bytes:
+    return orjson.dumps(row)
+
+
+def load_row(payload: bytes) -> list:
+    # orjson writes NaN as null; adapt_flat() rows never hold None otherwise.
+    return [float('nan') if value is None else value for value in orjson.loads(payload)]
+
+
+class FeatureStore:
+    # Per-listing feature rows keyed by listing_id. A listing seen again
+    # unchanged reuses its row as stored; an edited one recomputes only the
+    # features whose inputs changed. Each row keeps the listing as given
+    # (FlatRawInfo JSON, also what content_hash covers), its features and
+    # the price of the last rescore_all, cleared whenever the listing changes.
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.unchanged = 0
+        self.updated = 0
+        self.created = 0
+        # server.serve imports the API, and with it this store, before it
+        # forks the workers; a SQLite connection must not cross fork().
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use in each process; callers hold self._lock.
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(SCHEMA)
+        return self._conn
+
+    def features(self, flat: FlatRawInfo) -> list:
+        raw_json = flat.model_dump_json().encode()
+        digest = content_hash(raw_json)
+        with self._lock:
+            stored = self._db.execute(
+                "SELECT content_hash, features, feature_version FROM listings WHERE listing_id = ?",
+                (flat.listing_id,)).fetchone()
+            if stored is not None and stored[0] == digest and stored[2] == FEATURE_VERSION:
+                self.unchanged += 1
+                return load_row(stored[1])
+            previous = None
+            if stored is not None and stored[2] == FEATURE_VERSION:
+                previous = self._db.execute("SELECT raw FROM listings WHERE listing_id = ?",
+                                              (flat.listing_id,)).fetchone()[0]
+
+        if previous is not None:
+            previous = orjson.loads(previous)
+            changed = {field for field, value in flat.model_dump().items() if previous.get(field) != value}
+            row = update_row(flat, load_row(stored[1]), changed)
+            counter = "updated"
+        else:
+            row = adapt_flat(flat)
+            counter = "created"
+
+        with self._lock:
+            self._db.execute(UPSERT, (flat.listing_id, digest, raw_json.decode(), dump_row(row),
+                                        FEATURE_VERSION, time.time()))
+            setattr(self, counter, getattr(self, counter) + 1)
+        return row
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def chunks(self, chunk_size: int):
+        # (listing ids, content hashes, raw listings, feature rows, feature
+        # versions) in listing_id order, one chunk at a time.
+        last_id = None
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT listing_id, content_hash, raw, features, feature_version FROM listings "
+                    "WHERE ? IS NULL OR listing_id > ? ORDER BY listing_id LIMIT ?",
+                    (last_id, last_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield ([row[0] for row in rows], [row[1] for row in rows], [orjson.loads(row[2]) for row in rows],
+                   [load_row(row[3]) for row in rows], [row[4] for row in rows])
+
+    def save_scores(self, listing_ids: list, hashes: list, prices, model_version: str,
+                    rebuilt: Optional[dict] = None):
+        # rebuilt maps listing_id to (content hash, feature row recomputed
+        # for the current FEATURE_VERSION). hashes are the content hashes the rows
+        # were read with: a listing edited since then keeps its new row and
+        # gets no price for content it no longer has.
+        scored_at = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            if rebuilt:
+                self._db.executemany(
+                    "UPDATE listings SET features = ?, feature_version = ? WHERE listing_id = ? AND content_hash = ?",
+                    [(dump_row(row), FEATURE_VERSION, listing_id, digest)
+                     for listing_id, (digest, row) in rebuilt.items()])
+            self._db.executemany(
+                "UPDATE listings SET predicted_price = ?, model_version = ?, scored_at = ? "
+                "WHERE listing_id = ? AND content_hash = ?",
+                [(float(price), model_version, scored_at, listing_id, digest)
+                 for listing_id, digest, price in zip(listing_ids, hashes, prices)])
+            self._db.execute("COMMIT")
+
+    def stats(self) -> dict:
+        size = len(self)
+        with self._lock:
+            return {
+                "path": self.path,
+                "size": size,
+                "feature_version": FEATURE_VERSION,
+                "unchanged": self.unchanged,
+                "updated": self.updated,
+                "created": self.created,
+            }
+
+
+def prepared_frame(rows: list, raws: list) -> pd.DataFrame:
+    # Feature rows plus the fields calibration reads that are not features.
+    df = pd.DataFrame(rows, columns=FEATURES)
+    df['street'] = [raw.get('street') for raw in raws]
+    df['complex'] = [raw.get('complex') for raw in raws]
+    return df
+
+
+def rescore_all(store: FeatureStore, chunk_size: int = 50_000) -> dict:
+    # Scores every stored listing with the active model, a chunk at a time
+    # and vectorized over the stored rows. Rows built under another
+    # FEATURE_VERSION are rebuilt from their listings with adapter() first.
+    # Prices go through the same ensemble and calibration as the API.
+    from server.api import registry, score_prepared
+
+    started = time.perf_counter()
+    if not registry.ready:
+        registry.load(warmup=False)
+    version = registry.current.version
+
+    total = rebuilt_total = 0
+    for listing_ids, hashes, raws, rows, versions in store.chunks(chunk_size):
+        stale = [i for i, row_version in enumerate(versions) if row_version != FEATURE_VERSION]
+        rebuilt = {}
+        if stale:
+            fresh = adapter(pd.DataFrame([raws[i] for i in stale]))[FEATURES].to_numpy(dtype=object).tolist()
+            for i, row in zip(stale, fresh):
+                rows[i] = row
+                rebuilt[listing_ids[i]] = (hashes[i], row)
+        prices = score_prepared(prepared_frame(rows, raws))
+        store.save_scores(listing_ids, hashes, prices, version, rebuilt)
+        total += len(listing_ids)
+        rebuilt_total += len(rebuilt)
+        logger.info(f"Rescored {total} listings")
+
+    seconds = time.perf_counter() - started
+    logger.info(f"Rescored {total} listings with model {version} in {seconds:.1f}s "
+                f"({rebuilt_total} feature rows rebuilt)")
+    return {"listings": total, "rebuilt": rebuilt_total, "model_version": version, "seconds": seconds}
+
+
+if __name__ == "__main__":
+    # Bulk scoring should not fill the prediction cache.
+    os.environ.setdefault("PREDICTION_CACHE_SIZE", "0")
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=FEATURE_STORE_PATH, required=FEATURE_STORE_PATH is None)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    args = parser.parse_args()
+    rescore_all(FeatureStore(args.path), args.chunk_size)
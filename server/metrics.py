@@ -0,0 +1,133 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; stages range from ~10 us (scalar calibration steps) to seconds
+# (adapter on a large batch).
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    # Prometheus histogram with a single label; exposition is cumulative
+    # per bucket, as the text format expects.
+    def __init__(self, name: str, documentation: str, label: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {"counts": [0] * (len(self.buckets) + 1),
+                                                      "sum": 0.0}
+            series["counts"][bisect.bisect_left(self.buckets, seconds)] += 1
+            series["sum"] += seconds
+
+    def observe_all(self, timings: dict):
+        for label_value, seconds in timings.items():
+            self.observe(label_value, seconds)
+
+    @contextmanager
+    def time(self, label_value: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label_value, time.perf_counter() - started)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, series in sorted(self._series.items()):
+                label = f'{self.label}="{label_value}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series["counts"]):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f"{self.name}_sum{{{label}}} {series['sum']}")
+                lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label: str):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value: str, amount: float = 1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for label_value, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, label_value: str, value: float):
+        with self._lock:
+            self._values[label_value] = value
+
+
+STAGE_SECONDS = Histogram("rent_price_stage_seconds",
+                          "Time spent in each scoring stage.",
+                          "stage")
+REQUEST_SECONDS = Histogram("rent_price_request_seconds",
+                            "Time spent handling a request, by route.",
+                            "route")
+
+
+INFERENCE_QUEUE = Gauge("rent_price_inference_calls",
+                        "Scoring calls waiting in or running on the inference executor.",
+                        "state")
+INFERENCE_REJECTED = Counter("rent_price_inference_rejected_total",
+                             "Scoring calls shed by the inference executor, by reason.",
+                             "reason")
+PREDICT_TIER = Counter("rent_price_predict_tier_total",
+                       "/predict calls scored, by the ensemble tier used.",
+                       "tier")
+
+
+def render_metrics() -> str:
+    return (STAGE_SECONDS.render() + REQUEST_SECONDS.render()
+            + INFERENCE_QUEUE.render() + INFERENCE_REJECTED.render() + PREDICT_TIER.render())
+
+
+class RequestTimingMiddleware:
+    # Plain ASGI middleware: BaseHTTPMiddleware would add a task and a
+    # response copy to every request it times.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # Labelled by route template, not raw path, so unknown URLs can't
+            # grow the label set.
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(route.path if route is not None else "unmatched",
+                                    time.perf_counter() - started)
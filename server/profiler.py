@@ -0,0 +1,83 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    # Samples the stack of every other thread at a fixed interval and counts
+    # identical stacks. Output is in collapsed-stack format, one
+    # "frame;frame;frame count" line per stack, which flamegraph.pl and
+    # speedscope read directly. Costs nothing while stopped.
+    def __init__(self):
+        self.interval = 0.01
+        self.samples = Counter()
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._samples_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval_ms: float = 10):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.interval = interval_ms / 1000
+            self.samples = Counter()
+            self.started_at = time.time()
+            self.stopped_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.stopped_at = time.time()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(stack)))
+            with self._samples_lock:
+                self.samples.update(stacks)
+
+    def collapsed(self) -> str:
+        with self._samples_lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def stats(self) -> dict:
+        with self._samples_lock:
+            samples, stacks = sum(self.samples.values()), len(self.samples)
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "samples": samples,
+            "stacks": stacks,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+        }
@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Optional
+
+import numpy as np
+
+from train_and_test.config import LATENCY_TIERS
+from train_and_test.ensemble import FusedEnsemble, load_ensemble, model_version
+
+logger = logging.getLogger(__name__)
+
+# Timed runs per tier when a model is warmed up.
+TIER_TIMING_RUNS = 5
+
+
+@dataclass(frozen=True)
+class LoadedModel:
+    version: str
+    path: str
+    ensemble: FusedEnsemble
+    loaded_at: float
+    load_seconds: float
+    # Median single-call latency per LATENCY_TIERS tier, as measured by
+    # time_tiers() when the registry warms the model up.
+    tier_latency_ms: dict = field(default_factory=dict)
+
+    def predict(self, X, tier: str = "full") -> np.ndarray:
+        spec = LATENCY_TIERS[tier]
+        return self.ensemble.predict(X, spec["seeds"], spec["trees"])
+
+    def time_tiers(self, rows: list) -> dict:
+        # Runs every tier once, then times it on rows.
+        tier_latency_ms = {}
+        for tier in LATENCY_TIERS:
+            self.predict(rows, tier)
+            timings = []
+            for _ in range(TIER_TIMING_RUNS):
+                started = time.perf_counter()
+                self.predict(rows, tier)
+                timings.append(time.perf_counter() - started)
+            tier_latency_ms[tier] = float(np.median(timings)) * 1000
+        logger.info("Tier latency: " + ", ".join(f"{tier} {ms:.2f}ms" for tier, ms in tier_latency_ms.items()))
+        return tier_latency_ms
+
+    def tier_for(self, budget_ms: float) -> str:
+        # The most accurate tier measured to fit the budget, else the
+        # fastest; unmeasured models always run in full. The timings are
+        # of the ensemble alone on the warmup rows (one listing): queueing,
+        # the adapter and calibration are not in them, so a budget that
+        # only just fits can still be missed.
+        if not self.tier_latency_ms:
+            return "full"
+        for tier, ms in self.tier_latency_ms.items():
+            if ms <= budget_ms:
+                return tier
+        return tier
+
+
+class ModelRegistry:
+    def __init__(self, model_path: str, fused_dir: str, warmup_rows: Optional[list] = None,
+                 bundle_path: Optional[str] = None):
+        # With bundle_path set the model comes from a serving bundle and
+        # model_path/fused_dir are not read.
+        self.model_path = model_path
+        self.fused_dir = fused_dir
+        self.warmup_rows = warmup_rows
+        self.bundle_path = bundle_path
+        self._current: Optional[LoadedModel] = None
+        # Tables of the bundle the process started from; see load().
+        self._tables_version: Optional[str] = None
+        self._reload_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._current is not None
+
+    @property
+    def current(self) -> LoadedModel:
+        if self._current is None:
+            raise RuntimeError("Model registry is empty — call load() first")
+        return self._current
+
+    def _read_version(self) -> tuple:
+        if self.bundle_path is not None:
+            from server.bundle import ServingBundle
+            bundle = ServingBundle(self.bundle_path)
+            return bundle.meta["model_version"], bundle
+        with open(self.model_path, "rb") as f:
+            payload = f.read()
+        return model_version(payload), payload
+
+    def load(self, warmup: bool = True) -> LoadedModel:
+        # warmup=False is for a parent about to fork workers: the first
+        # prediction starts catboost's thread pool, which must not be forked.
+        # Requests keep the snapshot they started with, so the swap below
+        # never changes a model under a running prediction.
+        with self._reload_lock:
+            started = time.perf_counter()
+            version, payload = self._read_version()
+
+            if self.bundle_path is not None:
+                # Only the model is reloaded: the adapter and calibration read
+                # their tables once, at import. A bundle rebuilt with other
+                # tables needs a restart, or the new model would be scored
+                # with stale ones.
+                tables_version = payload.tables_version()
+                if self._tables_version is None:
+                    self._tables_version = tables_version
+                elif tables_version != self._tables_version:
+                    raise RuntimeError(f"Bundle {self.bundle_path} ({payload.version}) has new adapter/calibration "
+                                       f"tables ({self._tables_version} -> {tables_version}); "
+                                       f"restart the server to load them")
+
+            if self._current is not None and self._current.version == version:
+                logger.info(f"Model {version} is already active")
+                return self._current
+
+            if self.bundle_path is not None:
+                path = self.bundle_path
+                logger.info(f"Loading model {version} from bundle {path} ({payload.version})...")
+                ensemble = payload.ensemble()
+            else:
+                path = self.model_path
+                logger.info(f"Loading model {version} from {path}...")
+                ensemble = load_ensemble(payload, self.fused_dir)
+            candidate = LoadedModel(
+                version=version,
+                path=path,
+                ensemble=ensemble,
+                loaded_at=time.time(),
+                load_seconds=0.0,
+            )
+            if warmup and self.warmup_rows is not None:
+                candidate = replace(candidate, tier_latency_ms=candidate.time_tiers(self.warmup_rows))
+
+            loaded = replace(candidate, load_seconds=time.perf_counter() - started)
+            self._current = loaded
+            logger.info(f"Model {version} active ({loaded.load_seconds:.3f}s)")
+            return loaded
+
+    def warmup(self) -> LoadedModel:
+        # Warms up and times a model loaded with warmup=False, as each
+        # pre-forked worker does after the fork.
+        with self._reload_lock:
+            loaded = self.current
+            if self.warmup_rows is not None:
+                loaded = replace(loaded, tier_latency_ms=loaded.time_tiers(self.warmup_rows))
+                self._current = loaded
+            return loaded
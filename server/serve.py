@@ -0,0 +1,95 @@
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# A worker that exits sooner than WORKER_MIN_UPTIME after its start counts
+# as a failed start: restarts back off exponentially from RESTART_BACKOFF
+# up to RESTART_BACKOFF_MAX seconds, and after MAX_FAILED_STARTS in a row
+# the server shuts down instead of fork-looping.
+WORKER_MIN_UPTIME = 10.0
+RESTART_BACKOFF = 0.5
+RESTART_BACKOFF_MAX = 30.0
+MAX_FAILED_STARTS = 5
+
+
+def serve(host: str, port: int, workers: int):
+    # Pre-fork launcher: the parent binds the socket and loads the model,
+    # then forks the workers, so the catboost model, the imported modules
+    # and (from a serving bundle) the mapped arrays are shared copy-on-write
+    # instead of loaded once per worker as `uvicorn --workers` does.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+
+    from server.api import app, registry
+    registry.load(warmup=False)
+
+    def spawn() -> int:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # A child must never return into the parent's supervisor loop.
+            try:
+                registry.warmup()
+                # The lifespan's load sees the model already active and skips it.
+                uvicorn.Server(uvicorn.Config(app, log_level="warning")).run(sockets=[sock])
+            except BaseException:
+                logger.exception("Worker failed")
+                os._exit(1)
+            os._exit(0)
+        return pid
+
+    children = {spawn(): time.monotonic() for _ in range(workers)}
+    logger.info(f"Serving on {host}:{port} with {workers} pre-forked workers")
+
+    stopping = False
+    failed = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    failed_starts = 0
+    while children:
+        pid, status = os.wait()
+        uptime = time.monotonic() - children.pop(pid)
+        if stopping:
+            continue
+        failed_starts = failed_starts + 1 if uptime < WORKER_MIN_UPTIME else 0
+        if failed_starts >= MAX_FAILED_STARTS:
+            logger.error(f"Worker {pid} exited with status {status}: {failed_starts} workers in a row "
+                         f"died within {WORKER_MIN_UPTIME:.0f}s of starting, shutting down")
+            stop(None, None)
+            failed = True
+            continue
+        delay = min(RESTART_BACKOFF * 2 ** (failed_starts - 1), RESTART_BACKOFF_MAX) if failed_starts else 0
+        logger.warning(f"Worker {pid} exited with status {status} after {uptime:.1f}s, restarting it"
+                       + (f" in {delay:.1f}s" if delay else ""))
+        time.sleep(delay)
+        if not stopping:
+            children[spawn()] = time.monotonic()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
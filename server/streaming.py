@@ -0,0 +1,51 @@
+from typing import AsyncIterator, List, Optional
+
+from starlette.responses import StreamingResponse
+
+# Chunks start small so the first results go out quickly, then double up
+# to the caller's chunk size.
+FIRST_CHUNK_SIZE = 64
+# A longer line is reported as an error instead of being buffered whole.
+MAX_LINE_BYTES = 64 * 1024
+
+
+class NDJSONResponse(StreamingResponse):
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        # The body iterator reads the request body while the response is
+        # sent. The base class would also listen for a disconnect on
+        # receive() and swallow body chunks doing it; a disconnect surfaces
+        # from request.stream() instead.
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def ndjson_chunks(body: AsyncIterator[bytes], chunk_size: int,
+                        first_chunk_size: int = FIRST_CHUNK_SIZE) -> AsyncIterator[List[Optional[bytes]]]:
+    # Lists of non-blank lines; None stands for a line over MAX_LINE_BYTES.
+    buffer = b""
+    skipping = False
+    lines = []
+    size = min(first_chunk_size, chunk_size)
+    async for data in body:
+        *complete, buffer = (buffer + data).split(b"\n")
+        for line in complete:
+            if skipping:
+                skipping = False
+            elif line.strip():
+                lines.append(line if len(line) <= MAX_LINE_BYTES else None)
+        if len(buffer) > MAX_LINE_BYTES:
+            if not skipping:
+                lines.append(None)
+                skipping = True
+            buffer = b""
+        if len(lines) >= size:
+            yield lines
+            lines = []
+            size = min(size * 2, chunk_size)
+    if buffer.strip() and not skipping:
+        lines.append(buffer)
+    if lines:
+        yield lines
@@ -0,0 +1,121 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from server.adapter import ARTIFACTS_DIR, adapter
+from train_and_test.config import CAT_FEATURES, FEATURES
+from train_and_test.data import load_raw
+from train_and_test.features_engineering import prepare_data
+
+LISTING_FIELDS = ['listing_id', 'total_area', 'rooms_count', 'renovation', 'parking', 'lat', 'lon',
+                  'building_type', 'room_type', 'loggia_count', 'city', 'street', 'complex']
+
+
+def reference_adapter(df: pd.DataFrame) -> pd.DataFrame:
+    # The row-wise adapter() as it was before vectorization, kept verbatim
+    # apart from reading the artifacts here.
+    COMBO_FREQ = joblib.load(os.path.join(ARTIFACTS_DIR, "combo_freq.pkl"))
+    AREA_THRESHOLD = joblib.load(os.path.join(ARTIFACTS_DIR, "area_threshold.pkl"))
+    DIST_CENTER_MEDIAN = joblib.load(os.path.join(ARTIFACTS_DIR, "dist_center_median.pkl"))
+
+    df = df.copy()
+
+    categorical_cols = ['room_type', 'building_type', 'parking', 'renovation', 'city']
+    for col in categorical_cols:
+        df[col] = df[col].fillna('unknown').astype(str)
+
+    numeric_cols = ['total_area', 'rooms_count', 'lat', 'lon', 'floor', 'floors_total']
+    for col in numeric_cols:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    df['total_area'] = df['total_area'].fillna(60)
+    df['rooms_count'] = df['rooms_count'].fillna(2)
+    df['lat'] = df['lat'].fillna(np.nan)
+    df['lon'] = df['lon'].fillna(np.nan)
+    df['floor'] = df['floor'].fillna(5)
+    df['floors_total'] = df['floors_total'].replace(0, np.nan).fillna(10)
+
+    df['log_area'] = np.log1p(df['total_area'])
+    df['area_sq'] = df['total_area'] ** 2
+    df['flag_big_area'] = (df['total_area'] > AREA_THRESHOLD).astype(int)
+
+    df['floor_ratio'] = df['floor'] / df['floors_total']
+    df['floor_ratio'] = df['floor_ratio'].clip(0, 1)
+
+    df['area_room_combo'] = (
+        df['total_area'].round().astype(int).astype(str) + '_' +
+        df['rooms_count'].astype(int).astype(str)
+    )
+
+    df['combo_frequency'] = df['area_room_combo'].map(COMBO_FREQ).fillna(0)
+    df['rarity_index'] = 1 / (df['combo_frequency'] + 1)
+
+    lux_anchor_keywords = [
+        'двухуровнев', 'двухэтаж', 'панорам',
+        'француз', 'терраса', 'консьерж',
+        'valet', 'лобби', 'residence',
+    ]
+
+    df['lux_anchor_flag'] = (
+        df.get('description', '')
+        .fillna('')
+        .str.lower()
+        .apply(lambda x: int(any(k in x for k in lux_anchor_keywords)))
+    )
+
+    is_moscow = (df['city'] == 'Москва').astype(int)
+    good_renovation = df['renovation'].isin(['Дизайнерский', 'Евроремонт']).astype(int)
+
+    df['exp'] = (
+        df['total_area']
+        * is_moscow
+        * good_renovation
+        * df['rarity_index']
+    )
+
+    CITY_CENTERS = {
+        'Москва': (55.7558, 37.6173),
+        'Санкт-Петербург': (59.9343, 30.3351),
+        'Свердловская область': (56.8389, 60.6057),
+    }
+
+    def geo_dist(row):
+        if row['city'] not in CITY_CENTERS:
+            return np.nan
+        lat0, lon0 = CITY_CENTERS[row['city']]
+        if pd.isna(row['lat']) or pd.isna(row['lon']):
+            return np.nan
+        return np.sqrt((row['lat'] - lat0) ** 2 + (row['lon'] - lon0) ** 2)
+
+    df['dist_center'] = df.apply(geo_dist, axis=1)
+    df['dist_center'] = df['dist_center'].fillna(DIST_CENTER_MEDIAN)
+
+    return df
+
+
+@pytest.fixture(scope="module")
+def listings() -> pd.DataFrame:
+    # test.xlsx in the /predict schema: parsed fields from prepare_data,
+    # floors and description straight from the raw columns.
+    raw = load_raw("test")
+    df = prepare_data(raw)[LISTING_FIELDS].astype(object)
+    df = df.where(df.notna(), None)
+    df['floor'] = raw['Этаж']
+    df['floors_total'] = raw['Этажность']
+    df['description'] = raw['Описание']
+    return df
+
+
+def test_adapter_matches_rowwise_reference(listings):
+    expected = reference_adapter(listings)
+    actual = adapter(listings)
+
+    for col in FEATURES:
+        if col in CAT_FEATURES:
+            assert actual[col].astype(str).tolist() == expected[col].tolist(), col
+        else:
+            np.testing.assert_allclose(actual[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float),
+                                       rtol=0, atol=0, equal_nan=True, err_msg=col)
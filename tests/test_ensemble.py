@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from catboost import CatBoostRegressor
+
+from train_and_test.config import CAT_FEATURES, FEATURES, TARGET
+from train_and_test.data import load_prepared
+from train_and_test.ensemble import LEAF_EVAL_MAX_ROWS, FusedEnsemble
+
+# Small seeds with uneven tree counts, so per-seed ranges are not uniform.
+SEED_ITERATIONS = {11: 40, 22: 25, 33: 60}
+
+
+@pytest.fixture(scope="module")
+def trained():
+    df = load_prepared("train")
+    models = []
+    for seed, iterations in SEED_ITERATIONS.items():
+        model = CatBoostRegressor(iterations=iterations, depth=4, random_seed=seed,
+                                  verbose=False, allow_writing_files=False)
+        model.fit(df[FEATURES], np.log1p(df[TARGET]), cat_features=CAT_FEATURES)
+        models.append(model)
+    return models, df[FEATURES]
+
+
+def averaged(models: list, X, n_trees=None) -> np.ndarray:
+    return np.mean([np.expm1(model.predict(X, ntree_end=min(n_trees or model.tree_count_, model.tree_count_)))
+                    for model in models], axis=0)
+
+
+# Rows up to LEAF_EVAL_MAX_ROWS take the leaf-index path, more the per-seed
+# predict path.
+@pytest.mark.parametrize("rows", [1, LEAF_EVAL_MAX_ROWS, 200])
+def test_fused_matches_per_seed_average(trained, rows):
+    models, X = trained
+    ensemble = FusedEnsemble.from_models(models)
+    np.testing.assert_allclose(ensemble.predict(X.iloc[:rows]), averaged(models, X.iloc[:rows]), rtol=1e-9)
+
+
+@pytest.mark.parametrize("rows", [1, 200])
+@pytest.mark.parametrize("n_models, n_trees", [(1, None), (2, 30), (3, 10)])
+def test_fused_tier_matches_truncated_seeds(trained, rows, n_models, n_trees):
+    models, X = trained
+    ensemble = FusedEnsemble.from_models(models)
+    np.testing.assert_allclose(ensemble.predict(X.iloc[:rows], n_models, n_trees),
+                               averaged(models[:n_models], X.iloc[:rows], n_trees), rtol=1e-9)
+
+
+def test_fused_round_trip(trained, tmp_path):
+    models, X = trained
+    ensemble = FusedEnsemble.from_models(models)
+    ensemble.save(str(tmp_path), "test")
+    loaded = FusedEnsemble.load(str(tmp_path))
+    np.testing.assert_allclose(loaded.predict(X.iloc[:50]), ensemble.predict(X.iloc[:50]), rtol=1e-12)
@@ -0,0 +1,18 @@
+import numpy as np
+
+from train_and_test.geo import NeighbourIndex
+
+
+def test_exclude_self_with_shared_coordinates():
+    # Five listings per building at identical coordinates, each with its own
+    # price: none may see its own price among its neighbours.
+    rng = np.random.default_rng(0)
+    lat = np.repeat(55.7 + rng.random(30) * 0.1, 5)
+    lon = np.repeat(37.6 + rng.random(30) * 0.1, 5)
+    price = np.arange(len(lat), dtype=float) * 1000
+    index = NeighbourIndex(lat, lon, price)
+
+    for k, radius_km in [(10, np.inf), (2, np.inf), (64, 1.0)]:
+        prices = index._neighbour_prices(lat, lon, k, radius_km, exclude_self=True)
+        assert prices.shape == (len(lat), k)
+        assert not (prices == price[:, None]).any()
@@ -1,52 +1,138 @@
+import argparse
 import pandas as pd
 import joblib
 import os
+import time
+from collections import Counter
 
+from train_and_test.data import RAW_DIR, as_raw_text, fingerprint, load_prepared, load_raw, read_chunks
 from train_and_test.features_engineering import prepare_data
+from train_and_test.geo import NeighbourIndex
+from train_and_test.postproccesing import build_calibration
+from train_and_test.stats import QuantileSketch
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ARTIFACTS_DIR = os.path.join(BASE_DIR, "server", "artifacts")
 os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+STATS_PATH = os.path.join(ARTIFACTS_DIR, "artifact_stats.pkl")
 
 
-def build_artifacts():
-    print("Loading train data...")
-    train_df = pd.read_excel(os.path.join(BASE_DIR, "data/raw/train.xlsx"))
+def _merged_median(sketch: QuantileSketch, values: pd.Series) -> float:
+    return QuantileSketch(sketch.capacity).merge(sketch).add(values).median()
+
 
-    print("Preparing train data...")
-    train_df = prepare_data(train_df)
+def empty_stats() -> dict:
+    # Mergeable state behind combo_freq.pkl, area_threshold.pkl and
+    # dist_center_median.pkl; "sources" lists the fingerprints of the files
+    # already folded in.
+    return {
+        "combo_freq": Counter(),
+        "area": QuantileSketch(),
+        "rooms": QuantileSketch(),
+        "dist_center": QuantileSketch(),
+        "sources": [],
+    }
 
-    train_df['total_area'] = pd.to_numeric(train_df['total_area'], errors='coerce')
-    train_df['rooms_count'] = pd.to_numeric(train_df['rooms_count'], errors='coerce')
 
-    train_df['total_area'] = train_df['total_area'].fillna(train_df['total_area'].median())
-    train_df['rooms_count'] = train_df['rooms_count'].fillna(train_df['rooms_count'].median())
+def fold_listings(stats: dict, df: pd.DataFrame) -> dict:
+    total_area = pd.to_numeric(df['total_area'], errors='coerce')
+    rooms_count = pd.to_numeric(df['rooms_count'], errors='coerce')
 
-    train_df['area_room_combo'] = (
-            train_df['total_area']
+    # Gaps are filled with the median over everything folded so far plus
+    # this batch: for a full build that is the median of the whole history.
+    if total_area.isna().any():
+        total_area = total_area.fillna(_merged_median(stats["area"], total_area))
+    if rooms_count.isna().any():
+        rooms_count = rooms_count.fillna(_merged_median(stats["rooms"], rooms_count))
+    stats["area"].add(total_area)
+    stats["rooms"].add(rooms_count)
+
+    area_room_combo = (
+            total_area
             .round()
             .astype(int)
             .astype(str)
             + '_'
-            + train_df['rooms_count']
+            + rooms_count
             .round()
             .astype(int)
             .astype(str)
     )
+    stats["combo_freq"].update(area_room_combo.value_counts().to_dict())
+
+    if 'dist_center' not in df.columns:
+        raise ValueError("dist_center not found in train_df — check prepare_data")
+    stats["dist_center"].add(df['dist_center'])
+    return stats
 
-    combo_freq = train_df['area_room_combo'].value_counts().to_dict()
-    joblib.dump(combo_freq, os.path.join(ARTIFACTS_DIR, "combo_freq.pkl"))
 
-    area_threshold = train_df['total_area'].quantile(0.9)
-    joblib.dump(area_threshold, os.path.join(ARTIFACTS_DIR, "area_threshold.pkl"))
+def write_adapter_artifacts(stats: dict):
+    joblib.dump(dict(stats["combo_freq"].most_common()), os.path.join(ARTIFACTS_DIR, "combo_freq.pkl"))
+    joblib.dump(stats["area"].quantile(0.9), os.path.join(ARTIFACTS_DIR, "area_threshold.pkl"))
+    joblib.dump(stats["dist_center"].median(), os.path.join(ARTIFACTS_DIR, "dist_center_median.pkl"))
+    joblib.dump(stats, STATS_PATH)
 
-    if 'dist_center' not in train_df.columns:
-        raise ValueError("dist_center not found in train_df — check prepare_data")
 
-    dist_center_median = train_df['dist_center'].median()
-    joblib.dump(dist_center_median, os.path.join(ARTIFACTS_DIR, "dist_center_median.pkl"))
+def build_artifacts():
+    print("Loading train data...")
+    train_df = load_prepared("train")
+
+    calibration = build_calibration(train_df)
+    joblib.dump(calibration, os.path.join(ARTIFACTS_DIR, "calibration.pkl"))
+
+    NeighbourIndex.from_frame(train_df).save(os.path.join(ARTIFACTS_DIR, "neighbours.npz"))
+
+    prepare_stats = {}
+    prepare_data(load_raw("train"), stats=prepare_stats)
+    joblib.dump(prepare_stats, os.path.join(ARTIFACTS_DIR, "prepare_stats.pkl"))
+
+    stats = fold_listings(empty_stats(), train_df)
+    stats["sources"].append(fingerprint([os.path.join(RAW_DIR, "train.xlsx")]))
+    write_adapter_artifacts(stats)
+
+
+def _raw_chunks(path: str, chunk_size: int):
+    if path.endswith(".xlsx"):
+        yield pd.read_excel(path)
+    else:
+        yield from read_chunks(path, chunk_size)
+
+
+def update_artifacts(paths: list, chunk_size: int = 50_000):
+    # Folds new raw listings into the saved statistics, so the cost follows
+    # the size of the new files. Rows are prepared with the training
+    # prepare_stats, as in streaming prediction. Calibration tables,
+    # prepare_stats and the neighbour index are left as the last full build
+    # made them.
+    started = time.perf_counter()
+    stats = joblib.load(STATS_PATH)
+    prepare_stats = joblib.load(os.path.join(ARTIFACTS_DIR, "prepare_stats.pkl"))
+
+    rows = 0
+    for path in paths:
+        key = fingerprint([path])
+        if key in stats["sources"]:
+            print(f"{path} already folded in, skipping")
+            continue
+        for chunk in _raw_chunks(path, chunk_size):
+            fold_listings(stats, prepare_data(as_raw_text(chunk), stats=prepare_stats))
+            rows += len(chunk)
+        stats["sources"].append(key)
+
+    write_adapter_artifacts(stats)
+    print(f"Folded {rows} new rows in {time.perf_counter() - started:.2f}s "
+          f"({stats['area'].count:.0f} listings in total)")
 
 
 if __name__ == "__main__":
-    build_artifacts()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--update", nargs="+", metavar="PATH",
+                        help="raw listings (xlsx, CSV or Parquet) to fold into the existing statistics")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    args = parser.parse_args()
+
+    if args.update:
+        update_artifacts(args.update, args.chunk_size)
+    else:
+        build_artifacts()
@@ -35,3 +35,11 @@ CAT_FEATURES = [
 
 SEEDS = [11, 22, 33, 44, 55]
 
+# Ensemble evaluation tiers for /predict, most accurate first: how many
+# seeds are evaluated and how many trees of each (None: all). The accuracy
+# each one gives up is measured by `python -m train_and_test.tiers`.
+LATENCY_TIERS = {
+    "full": {"seeds": None, "trees": None},
+    "fast": {"seeds": 2, "trees": 500},
+    "preview": {"seeds": 1, "trees": 250},
+}
@@ -0,0 +1,159 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+
+import pandas as pd
+
+from train_and_test.config import BASE_DIR, CAT_FEATURES, FEATURES, TARGET
+from train_and_test.features_engineering import prepare_data
+
+logger = logging.getLogger(__name__)
+
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+CACHE_DIR = os.path.join(BASE_DIR, "data", "cache")
+
+# Quantization settings for the cached training pool; empty means
+# CatBoost's defaults, which is what fitting on raw X would use.
+POOL_PARAMS = {}
+
+# Any change to these files invalidates the prepared-data cache.
+FEATURE_CODE = [
+    os.path.join(BASE_DIR, "train_and_test", "features_engineering.py"),
+    os.path.join(BASE_DIR, "train_and_test", "geo.py"),
+    # CAT_FEATURES and FEATURES decide columns and dtypes of prepare_data.
+    os.path.join(BASE_DIR, "train_and_test", "config.py"),
+]
+
+
+def fingerprint(paths: list) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def _to_columnar(df: pd.DataFrame) -> pd.DataFrame:
+    # Parquet needs one type per column; Excel cells like "Площадь комнат, м2"
+    # mix numbers and strings, so those are stored as strings.
+    for col in df.columns[df.dtypes == object]:
+        values = df[col].dropna()
+        if values.map(type).nunique() > 1:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _cached(name: str, kind: str, key: str, build) -> pd.DataFrame:
+    path = os.path.join(CACHE_DIR, f"{name}.{kind}.{key}.parquet")
+    if os.path.exists(path):
+        logger.info(f"Loading {name} ({kind}) from cache...")
+        return pd.read_parquet(path)
+
+    df = _to_columnar(build())
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for stale in glob.glob(os.path.join(CACHE_DIR, f"{name}.{kind}.*.parquet")):
+        os.remove(stale)
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return df
+
+
+# Raw columns parsed with .str; a chunk where one of them is empty must not
+# be read back as float.
+RAW_TEXT_COLUMNS = [
+    'Количество комнат', 'Тип', 'Метро', 'Адрес', 'Площадь, м2', 'Дом', 'Парковка',
+    'Описание', 'Ремонт', 'Площадь комнат, м2', 'Балкон', 'Окна', 'Санузел',
+    'Можно с детьми/животными', 'Дополнительно', 'Название ЖК', 'Серия дома',
+    'Лифт', 'Мусоропровод', 'Метро_станция', 'Метро_тип',
+]
+
+
+def as_raw_text(chunk: pd.DataFrame) -> pd.DataFrame:
+    for col in RAW_TEXT_COLUMNS:
+        if col in chunk.columns:
+            chunk[col] = chunk[col].astype(object)
+    return chunk
+
+
+def read_chunks(path: str, chunk_size: int):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def load_raw(name: str) -> pd.DataFrame:
+    source = os.path.join(RAW_DIR, f"{name}.xlsx")
+
+    def build():
+        logger.info(f"Reading {source}...")
+        return pd.read_excel(source)
+
+    return _cached(name, "raw", fingerprint([source]), build)
+
+
+def load_prepared(name: str) -> pd.DataFrame:
+    source = os.path.join(RAW_DIR, f"{name}.xlsx")
+
+    def build():
+        logger.info(f"Preparing {name} data...")
+        return prepare_data(load_raw(name))
+
+    return _cached(name, "prepared", fingerprint([source] + FEATURE_CODE), build)
+
+
+def pool_key(name: str) -> str:
+    # Prepared data plus everything that shapes the quantized pool, so new
+    # hyperparameters or seeds reuse it while new data, feature lists,
+    # quantization settings or catboost version rebuild it.
+    import catboost
+
+    source = os.path.join(RAW_DIR, f"{name}.xlsx")
+    config = json.dumps({"features": FEATURES, "cat_features": CAT_FEATURES, "target": TARGET,
+                         "params": POOL_PARAMS, "catboost": catboost.__version__}, sort_keys=True)
+    digest = hashlib.sha256((fingerprint([source] + FEATURE_CODE) + config).encode())
+    return digest.hexdigest()[:16]
+
+
+def cached_pool(name: str) -> tuple:
+    # Quantized CatBoost pool of FEATURES and log1p(TARGET), saved in
+    # CatBoost's own format. Returns its path, how long building it took
+    # (what every cache hit saves) and whether it came from the cache.
+    key = pool_key(name)
+    path = os.path.join(CACHE_DIR, f"{name}.pool.{key}.bin")
+    meta_path = os.path.join(CACHE_DIR, f"{name}.pool.{key}.json")
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            return path, json.load(f)["build_seconds"], True
+
+    import numpy as np
+    from catboost import Pool
+
+    started = time.perf_counter()
+    df = load_prepared(name)
+    pool = Pool(df[FEATURES], np.log1p(df[TARGET]), cat_features=CAT_FEATURES)
+    logger.info(f"Quantizing {name} pool...")
+    pool.quantize(**POOL_PARAMS)
+    build_seconds = time.perf_counter() - started
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for stale in glob.glob(os.path.join(CACHE_DIR, f"{name}.pool.*")):
+        os.remove(stale)
+    tmp_path = f"{path}.tmp"
+    pool.save(tmp_path)
+    os.replace(tmp_path, path)
+    with open(meta_path, "w") as f:
+        json.dump({"build_seconds": build_seconds}, f)
+    return path, build_seconds, False
+
+
+def load_pool(path: str):
+    from catboost import Pool
+    return Pool(f"quantized://{path}")
@@ -0,0 +1,200 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+import numpy as np
+from catboost import CatBoost, Pool, sum_models
+
+from train_and_test.config import BASE_DIR, FEATURES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join(BASE_DIR, "model", "catboost_model.pkl")
+FUSED_DIR = os.path.join(BASE_DIR, "model", "fused")
+
+# Up to this many rows the whole ensemble is evaluated from one
+# calc_leaf_indexes call; above it, per-seed tree ranges over a single Pool
+# are cheaper than gathering rows x trees leaf values.
+LEAF_EVAL_MAX_ROWS = 8
+
+
+def model_version(payload: bytes) -> str:
+    return hashlib.sha256(payload).hexdigest()[:12]
+
+
+class FusedEnsemble:
+    def __init__(self, model: CatBoost, leaf_values: np.ndarray, leaf_offsets: np.ndarray,
+                 tree_counts: list, scales: list, biases: list):
+        self.model = model
+        self.leaf_values = leaf_values
+        self.leaf_offsets = leaf_offsets
+        self.tree_counts = np.asarray(tree_counts, dtype=np.int64)
+        self.tree_starts = np.concatenate([[0], np.cumsum(self.tree_counts)[:-1]])
+        self.scales = np.asarray(scales, dtype=float)
+        self.biases = np.asarray(biases, dtype=float)
+        self.cat_features = model.get_cat_feature_indices()
+
+    @property
+    def n_models(self) -> int:
+        return len(self.tree_counts)
+
+    @classmethod
+    def from_models(cls, models: list) -> "FusedEnsemble":
+        # The summed model keeps every seed's trees (and its leaf values, since
+        # all weights are 1) in order; seed biases are applied separately.
+        # sum_models shares native state with its inputs; copy() detaches it so
+        # the source models can be garbage-collected.
+        fused = sum_models(models, weights=[1.0] * len(models)).copy()
+        fused.set_scale_and_bias(1.0, 0.0)
+        leaf_counts = np.asarray(fused.get_tree_leaf_counts(), dtype=np.int64)
+        leaf_offsets = np.concatenate([[0], np.cumsum(leaf_counts)[:-1]])
+        scales, biases = zip(*(model.get_scale_and_bias() for model in models))
+        return cls(fused,
+                   np.asarray(fused.get_leaf_values(), dtype=float),
+                   leaf_offsets,
+                   [model.tree_count_ for model in models],
+                   scales,
+                   biases)
+
+    def save(self, directory: str, source_version: str):
+        os.makedirs(directory, exist_ok=True)
+        self.model.save_model(os.path.join(directory, "model.cbm"))
+        np.save(os.path.join(directory, "leaf_values.npy"), self.leaf_values)
+        np.save(os.path.join(directory, "leaf_offsets.npy"), self.leaf_offsets)
+        meta = {
+            "source_version": source_version,
+            "tree_counts": self.tree_counts.tolist(),
+            "scales": self.scales.tolist(),
+            "biases": self.biases.tolist(),
+        }
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    @staticmethod
+    def saved_version(directory: str):
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                return json.load(f)["source_version"]
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def load(cls, directory: str) -> "FusedEnsemble":
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        model = CatBoost()
+        model.load_model(os.path.join(directory, "model.cbm"))
+        return cls(model,
+                   np.load(os.path.join(directory, "leaf_values.npy"), mmap_mode="r"),
+                   np.load(os.path.join(directory, "leaf_offsets.npy"), mmap_mode="r"),
+                   meta["tree_counts"],
+                   meta["scales"],
+                   meta["biases"])
+
+    def tree_ranges(self, n_models: Optional[int] = None, n_trees: Optional[int] = None) -> list:
+        # [start, end) of the trees evaluated: the first n_trees of each of
+        # the first n_models seeds (None: all). Adjacent ranges are merged.
+        ranges = []
+        for start, count in zip(self.tree_starts[:n_models], self.tree_counts[:n_models]):
+            end = start + (count if n_trees is None else min(count, n_trees))
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def predict_raw(self, X, n_models: Optional[int] = None, n_trees: Optional[int] = None) -> np.ndarray:
+        # Per-seed raw predictions of the first n_models seeds, each cut to
+        # its first n_trees trees; without either, the full ensemble.
+        n_models = n_models or self.n_models
+        counts = self.tree_counts[:n_models]
+        if n_trees is not None:
+            counts = np.minimum(counts, n_trees)
+        if len(X) <= LEAF_EVAL_MAX_ROWS:
+            # One Pool for every tree range, so the rows are converted once.
+            pool = Pool(X, cat_features=self.cat_features)
+            ranges = self.tree_ranges(n_models, n_trees)
+            leaves = np.hstack([self.model.calc_leaf_indexes(pool, ntree_start=start, ntree_end=end)
+                                for start, end in ranges]).astype(np.int64)
+            offsets = np.concatenate([self.leaf_offsets[start:end] for start, end in ranges])
+            per_tree = self.leaf_values[offsets + leaves]
+            sums = np.add.reduceat(per_tree, np.concatenate([[0], np.cumsum(counts)[:-1]]), axis=1)
+        else:
+            pool = Pool(X, cat_features=self.cat_features)
+            sums = np.column_stack([
+                self.model.predict(pool, prediction_type="RawFormulaVal",
+                                   ntree_start=start, ntree_end=start + count)
+                for start, count in zip(self.tree_starts, counts)
+            ])
+        return sums * self.scales[:n_models] + self.biases[:n_models]
+
+    def predict(self, X, n_models: Optional[int] = None, n_trees: Optional[int] = None) -> np.ndarray:
+        return np.expm1(self.predict_raw(X, n_models, n_trees)).mean(axis=1)
+
+
+def load_ensemble(payload: bytes, fused_dir: str = FUSED_DIR) -> FusedEnsemble:
+    version = model_version(payload)
+    if FusedEnsemble.saved_version(fused_dir) == version:
+        logger.info(f"Loading fused model {version} from {fused_dir}...")
+        return FusedEnsemble.load(fused_dir)
+    # joblib (and the pickled models) only load when there is no fused build,
+    # keeping server start-up free of them otherwise.
+    import joblib
+    logger.info(f"No fused build for model {version}, fusing in memory...")
+    return FusedEnsemble.from_models(joblib.load(io.BytesIO(payload)))
+
+
+def loop_predict(models: list, X) -> np.ndarray:
+    raw_prediction = np.zeros(len(X))
+    for model in models:
+        raw_prediction += np.expm1(model.predict(X)) / len(models)
+    return raw_prediction
+
+
+def _latency_ms(fn, repeats: int = 20) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def build_fused_ensemble(model_path: str = MODEL_PATH, fused_dir: str = FUSED_DIR) -> FusedEnsemble:
+    import joblib
+    with open(model_path, "rb") as f:
+        payload = f.read()
+    version = model_version(payload)
+    models = joblib.load(model_path)
+
+    logger.info(f"Fusing {len(models)} models ({version})...")
+    ensemble = FusedEnsemble.from_models(models)
+    ensemble.save(fused_dir, version)
+
+    from train_and_test.data import load_prepared
+    X = load_prepared("test")[FEATURES]
+    loaded = FusedEnsemble.load(fused_dir)
+
+    reference = loop_predict(models, X)
+    for rows in (1, LEAF_EVAL_MAX_ROWS, len(X)):
+        fused = np.concatenate([loaded.predict(X.iloc[i:i + rows]) for i in range(0, len(X), rows)])
+        max_rel_diff = np.max(np.abs(fused - reference) / np.abs(reference))
+        logger.info(f"Parity at {rows} rows per call: max relative diff {max_rel_diff:.2e}")
+        if max_rel_diff > 1e-9:
+            raise ValueError(f"Fused ensemble diverges from the averaging loop ({max_rel_diff:.2e})")
+
+    for rows in (1, LEAF_EVAL_MAX_ROWS, 4 * LEAF_EVAL_MAX_ROWS, len(X)):
+        batch = X.iloc[:rows]
+        loop_ms = _latency_ms(lambda: loop_predict(models, batch))
+        fused_ms = _latency_ms(lambda: loaded.predict(batch))
+        logger.info(f"{rows} rows: loop {loop_ms:.2f} ms, fused {fused_ms:.2f} ms")
+
+    return loaded
+
+
+if __name__ == "__main__":
+    build_fused_ensemble()
@@ -0,0 +1,148 @@
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from catboost import CatBoostRegressor
+from sklearn.model_selection import KFold
+
+from train_and_test.config import CAT_FEATURES, FEATURES, SEEDS, TARGET
+from train_and_test.data import load_prepared
+from train_and_test.features_engineering import neighbour_features
+from train_and_test.geo import NeighbourIndex
+from train_and_test.train import MODEL_PARAMS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_ITERATIONS = 5000
+EARLY_STOPPING_ROUNDS = 200
+NEIGHBOUR_COLUMNS = ['knn_median_price', 'radius_median_price']
+
+_shared = {}
+
+
+def parse_subset(spec: str) -> list:
+    # "base" is config.FEATURES; "base-exp+knn_median_price" drops and adds
+    # columns; anything else is a comma-separated column list.
+    if not spec.startswith("base"):
+        return [column.strip() for column in spec.split(",") if column.strip()]
+    features = list(FEATURES)
+    for sign, column in re.findall(r"([+-])(\w+)", spec[len("base"):]):
+        if sign == "+" and column not in features:
+            features.append(column)
+        elif sign == "-":
+            features.remove(column)
+    return features
+
+
+def _init_worker(df):
+    # Runs once per worker process, so the data is handed over once per
+    # worker instead of once per fold.
+    _shared['df'] = df
+
+
+def _fit_fold(features: list, train_idx: np.ndarray, val_idx: np.ndarray, seed: int,
+              params: dict, thread_count: int) -> dict:
+    started = time.perf_counter()
+    df = _shared['df']
+    train_df, val_df = df.iloc[train_idx].copy(), df.iloc[val_idx].copy()
+    if any(column in features for column in NEIGHBOUR_COLUMNS):
+        # Built from the training fold only, so validation prices never leak
+        # into the features.
+        index = NeighbourIndex.from_frame(train_df)
+        train_df = neighbour_features(train_df, index, exclude_self=True)
+        val_df = neighbour_features(val_df, index)
+
+    model = CatBoostRegressor(**params, random_seed=seed, thread_count=thread_count,
+                              allow_writing_files=False)
+    model.fit(train_df[features], np.log1p(train_df[TARGET]),
+              cat_features=[column for column in CAT_FEATURES if column in features],
+              eval_set=(val_df[features], np.log1p(val_df[TARGET])),
+              use_best_model=True)
+    predicted = np.expm1(model.predict(val_df[features]))
+    return {
+        "seed": seed,
+        "best_iterations": int(model.get_best_iteration()) + 1,
+        "log_mae": float(model.get_best_score()["validation"]["MAE"]),
+        "mae": float(np.mean(np.abs(predicted - val_df[TARGET].to_numpy()))),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def cross_validate(configs: dict, folds: int = 5, seeds: list = SEEDS, params: dict = None,
+                   workers: int = None) -> dict:
+    # Every (fold, seed) of a configuration runs as one job on a shared
+    # process pool; configurations run one after another so each gets its
+    # own wall-clock time.
+    df = load_prepared("train")
+    params = {**MODEL_PARAMS, "iterations": MAX_ITERATIONS,
+              "early_stopping_rounds": EARLY_STOPPING_ROUNDS, **(params or {})}
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=0).split(df))
+
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, folds * len(seeds)))
+    thread_count = max(1, cores // workers)
+    logger.info(f"{len(configs)} configurations x {folds} folds x {len(seeds)} seeds "
+                f"on {workers} workers x {thread_count} threads")
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(df,)) as pool:
+        for name, features in configs.items():
+            missing = [column for column in features if column not in df.columns and column not in NEIGHBOUR_COLUMNS]
+            if missing:
+                raise ValueError(f"Configuration {name}: unknown columns {missing}")
+            started = time.perf_counter()
+            futures = [pool.submit(_fit_fold, features, train_idx, val_idx, seed, params, thread_count)
+                       for train_idx, val_idx in splits for seed in seeds]
+            runs = [future.result() for future in futures]
+            maes = [run["mae"] for run in runs]
+            results[name] = {
+                "features": features,
+                "mae": float(np.mean(maes)),
+                "mae_std": float(np.std(maes)),
+                "log_mae": float(np.mean([run["log_mae"] for run in runs])),
+                "best_iterations": float(np.mean([run["best_iterations"] for run in runs])),
+                "wall_seconds": time.perf_counter() - started,
+                "cpu_seconds": sum(run["seconds"] for run in runs),
+                "runs": runs,
+            }
+            logger.info(f"{name}: MAE {results[name]['mae']:.0f} ± {results[name]['mae_std']:.0f}, "
+                        f"best iterations {results[name]['best_iterations']:.0f}, "
+                        f"{results[name]['wall_seconds']:.1f}s wall-clock")
+    return results
+
+
+def _param(value: str):
+    key, raw = value.split("=", 1)
+    try:
+        return key, json.loads(raw)
+    except json.JSONDecodeError:
+        return key, raw
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subset", action="append", default=None,
+                        help='feature subset: "base", "base-exp+knn_median_price" or a comma-separated list; repeatable')
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seeds", type=int, nargs="+", default=SEEDS)
+    parser.add_argument("--param", type=_param, action="append", default=[],
+                        help="CatBoost parameter override, e.g. depth=8 or learning_rate=0.1; repeatable")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--output", default=None, help="write full results as JSON")
+    args = parser.parse_args()
+
+    results = cross_validate({spec: parse_subset(spec) for spec in args.subset or ["base"]},
+                             args.folds, args.seeds, dict(args.param), args.workers)
+    print(f"{'configuration':<40} {'MAE':>9} {'± std':>7} {'best iters':>10} {'wall s':>8}")
+    for name, result in sorted(results.items(), key=lambda item: item[1]["mae"]):
+        print(f"{name:<40} {result['mae']:>9.0f} {result['mae_std']:>7.0f} "
+              f"{result['best_iterations']:>10.0f} {result['wall_seconds']:>8.1f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
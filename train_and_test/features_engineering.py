@@ -1,25 +1,49 @@
+import time
+from typing import Optional
+
 import pandas as pd
 import numpy as np
 
-def prepare_data(df: pd.DataFrame) -> pd.DataFrame:
-    df = rename_and_basic_parse(df)
-    df = address_features(df)
-    df = rooms(df)
-    df = floors(df)
-    df = balcony_features(df)
-    df = extras_features(df)
-    df = area_features(df)
-    df = elevator(df)
-    df = bathroom(df)
-    df = complex_features(df)
-    df = rarity_index(df)
-    df = lux_anchor(df)
-    df = cleanup(df)
-    df = expensive_extra(df)
-    df = geo_features(df)
+from train_and_test.config import CAT_FEATURES
+from train_and_test.geo import NeighbourIndex, dist_center
+
+# Dtype policy for prepared frames: strings the model or calibration groups
+# on become categories, flags int8 and counts int16 (set where they are
+# built), and model-only floats float32 once computed in float64 (CatBoost
+# casts its inputs to float32 anyway). price, coordinates, total_area and
+# dist_center stay float64: artifact statistics and the neighbour index are
+# taken from them.
+CATEGORY_COLS = CAT_FEATURES + ['complex', 'street']
+FLOAT32_COLS = ['rooms_count', 'ceiling_height', 'rooms', 'metro_minutes',
+                'floor_ratio', 'log_area', 'area_sq', 'rarity_index', 'exp']
+
+
+def prepare_data(df: pd.DataFrame,
+                 timings: Optional[dict] = None,
+                 stats: Optional[dict] = None) -> pd.DataFrame:
+    # Dataset statistics (area quantile, combo counts, fill medians) are taken
+    # from `stats` when present and computed from df (and stored in `stats`)
+    # otherwise, so a chunk can be prepared with the training statistics.
+    for stage in STAGES:
+        started = time.perf_counter()
+        df = stage(df, stats) if stage in STATEFUL_STAGES else stage(df)
+        if timings is not None:
+            timings[stage.__name__] = timings.get(stage.__name__, 0.0) + time.perf_counter() - started
     return df
 
 
+def stage_timings(df: pd.DataFrame, scales: tuple = (1, 10, 100)) -> pd.DataFrame:
+    report = {}
+    for scale in scales:
+        timings = {}
+        prepare_data(pd.concat([df] * scale, ignore_index=True), timings=timings)
+        report[len(df) * scale] = timings
+    report = pd.DataFrame(report)
+    report.loc['total'] = report.sum()
+    report.columns.name = 'rows'
+    return report
+
+
 def rename_and_basic_parse(df: pd.DataFrame) -> pd.DataFrame:
     rename_dict = {
         'ID  объявления': 'listing_id',
@@ -52,16 +76,18 @@ def rename_and_basic_parse(df: pd.DataFrame) -> pd.DataFrame:
         'Метро_минуты': 'metro_minutes',
         'Метро_тип': 'metro_transport'
     }
-    return df.rename(columns=rename_dict)
+    # copy=False: the raw columns are only read or replaced downstream.
+    return df.rename(columns=rename_dict, copy=False)
 
 
 def address_features(df: pd.DataFrame) -> pd.DataFrame:
-    df['city'] = df['address'].str.split(', ').str[0]
+    parts = df['address'].str.split(', ')
+    df['city'] = parts.str[0]
     street_keywords = [
         'улица', 'набережная', 'проспект',
         'бульвар', 'шоссе', 'переулок',
     ]
-    df['street'] = df['address'].str.split(', ').apply(
+    df['street'] = parts.apply(
         lambda parts: next(
             (p for p in parts if any(k in p for k in street_keywords)),
             None,
@@ -71,32 +97,37 @@ def address_features(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def rooms(df: pd.DataFrame) -> pd.DataFrame:
-    df['room_type'] = df['rooms_count'].str.split(', ').str[1]
-    room_numbers = df['rooms_count'].str.split(', ').str[0]
-    df['rooms_count'] = pd.to_numeric(room_numbers, errors='coerce')
+    parts = df['rooms_count'].str.split(', ')
+    df['room_type'] = parts.str[1]
+    df['rooms_count'] = pd.to_numeric(parts.str[0], errors='coerce')
     return df
 
 
-def balcony_features(df: pd.DataFrame) -> pd.DataFrame:
-    def parse_balcony(s):
-        if pd.isna(s):
-            return pd.Series([0, 0, 0, 0])
-        has_balcony = balcony_count = 0
-        has_loggia = loggia_count = 0
-        for part in s.split(', '):
-            if 'Балкон' in part:
-                has_balcony = 1
-                num = ''.join(filter(str.isdigit, part))
-                balcony_count = int(num) if num else 0
-            elif 'Лоджия' in part:
-                has_loggia = 1
-                num = ''.join(filter(str.isdigit, part))
-                loggia_count = int(num) if num else 0
-        return pd.Series([has_balcony, balcony_count, has_loggia, loggia_count])
+def _count_pair(series: pd.Series, first: str, second: str) -> pd.DataFrame:
+    # Vectorized form of the per-part loop: for each ", "-separated part,
+    # `first` wins over `second`, the count is all digits of the part, and
+    # the last matching part of a row sets the value.
+    parts = series.reset_index(drop=True).str.split(', ').explode().dropna()
+    counts = pd.to_numeric(parts.str.replace(r'\D', '', regex=True), errors='coerce').fillna(0).astype(np.int16)
+    is_first = parts.str.contains(first, regex=False)
+    is_second = parts.str.contains(second, regex=False) & ~is_first
+
+    # Flags int8, counts int16; callers assign the frame column by column,
+    # which keeps both dtypes.
+    result = pd.DataFrame({0: np.int8(0), 1: np.int16(0), 2: np.int8(0), 3: np.int16(0)},
+                          index=pd.RangeIndex(len(series)))
+    for offset, mask in ((0, is_first), (2, is_second)):
+        matched = counts[mask].groupby(level=0).last()
+        result.loc[matched.index, offset] = 1
+        result.loc[matched.index, offset + 1] = matched
+    result.index = series.index
+    return result
 
+
+def balcony_features(df: pd.DataFrame) -> pd.DataFrame:
     df[
         ['has_balcony', 'balcony_count', 'has_loggia', 'loggia_count']
-    ] = df['balcony'].apply(parse_balcony)
+    ] = _count_pair(df['balcony'], 'Балкон', 'Лоджия')
     return df
 
 
@@ -104,46 +135,36 @@ def extras_features(df: pd.DataFrame) -> pd.DataFrame:
     extras_dict = {
         'Ванна': 'bath',
         'Душевая кабина': 'shower',
-        'Интернет': 'internet',
         'Кондиционер': 'air_conditioner',
         'Мебель в комнатах': 'furniture_rooms',
         'Мебель на кухне': 'furniture_kitchen',
         'Посудомоечная машина': 'dishwasher',
         'Стиральная машина': 'washing_machine',
         'Телевизор': 'tv',
-        'Телефон': 'phone',
         'Холодильник': 'fridge',
     }
     for ru, en in extras_dict.items():
-        df[en] = df['extras'].str.contains(ru, na=False).astype(int)
+        df[en] = df['extras'].str.contains(ru, na=False).astype(np.int8)
     return df
 
 
-def area_features(df: pd.DataFrame) -> pd.DataFrame:
+def _stat(stats: Optional[dict], name: str, compute):
+    if stats is None:
+        return compute()
+    if name not in stats:
+        stats[name] = compute()
+    return stats[name]
+
+
+def area_features(df: pd.DataFrame, stats: Optional[dict] = None) -> pd.DataFrame:
     df['log_area'] = np.log1p(df['total_area'])
     df['area_sq'] = df['total_area'] ** 2
-    area_threshold = df['total_area'].quantile(0.9)
-    df['flag_big_area'] = (df['total_area'] > area_threshold).astype(int)
+    area_threshold = _stat(stats, 'area_threshold', lambda: df['total_area'].quantile(0.9))
+    df['flag_big_area'] = (df['total_area'] > area_threshold).astype(np.int8)
     return df
 
 
 def elevator(df: pd.DataFrame) -> pd.DataFrame:
-    def parse_elevator(s):
-        if pd.isna(s):
-            return pd.Series([0, 0, 0, 0])
-        has_pass = pass_count = 0
-        has_freight = freight_count = 0
-        for part in s.split(', '):
-            if 'Пасс' in part:
-                has_pass = 1
-                num = ''.join(filter(str.isdigit, part))
-                pass_count = int(num) if num else 0
-            elif 'Груз' in part:
-                has_freight = 1
-                num = ''.join(filter(str.isdigit, part))
-                freight_count = int(num) if num else 0
-        return pd.Series([has_pass, pass_count, has_freight, freight_count])
-
     df[
         [
             'has_passenger_elevator',
@@ -151,27 +172,11 @@ def elevator(df: pd.DataFrame) -> pd.DataFrame:
             'has_freight_elevator',
             'freight_elevator_count',
         ]
-    ] = df['elevator'].apply(parse_elevator)
+    ] = _count_pair(df['elevator'], 'Пасс', 'Груз')
     return df
 
 
 def bathroom(df: pd.DataFrame) -> pd.DataFrame:
-    def parse_bathroom(s):
-        if pd.isna(s):
-            return pd.Series([0, 0, 0, 0])
-        has_combined = combined_count = 0
-        has_separate = separate_count = 0
-        for part in s.split(', '):
-            if 'Совмещенный' in part:
-                has_combined = 1
-                num = ''.join(filter(str.isdigit, part))
-                combined_count = int(num) if num else 0
-            elif 'Раздельный' in part:
-                has_separate = 1
-                num = ''.join(filter(str.isdigit, part))
-                separate_count = int(num) if num else 0
-        return pd.Series([has_combined, combined_count, has_separate, separate_count])
-
     df[
         [
             'has_combined_bathroom',
@@ -179,7 +184,7 @@ def bathroom(df: pd.DataFrame) -> pd.DataFrame:
             'has_separate_bathroom',
             'separate_bathroom_count',
         ]
-    ] = df['bathroom'].apply(parse_bathroom)
+    ] = _count_pair(df['bathroom'], 'Совмещенный', 'Раздельный')
     return df
 
 
@@ -194,10 +199,10 @@ def floors(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def rarity_index(df: pd.DataFrame) -> pd.DataFrame:
+def rarity_index(df: pd.DataFrame, stats: Optional[dict] = None) -> pd.DataFrame:
     df['area_room_combo'] = df['total_area'].astype(str).str[:3] + '_' + df['rooms'].astype(str)
-    combo_counts = df['area_room_combo'].value_counts()
-    df['combo_frequency'] = df['area_room_combo'].map(combo_counts)
+    combo_counts = _stat(stats, 'combo_counts', lambda: df['area_room_combo'].value_counts())
+    df['combo_frequency'] = df['area_room_combo'].map(combo_counts).fillna(0)
     df['rarity_index'] = 1 / (df['combo_frequency'] + 1)
     return df
 
@@ -213,26 +218,27 @@ def lux_anchor(df: pd.DataFrame) -> pd.DataFrame:
         .str.lower()
         .fillna('')
         .apply(lambda x: any(k in x for k in lux_anchor_keywords))
-        .astype(int)
+        .astype(np.int8)
     )
     return df
 
 
-def cleanup(df: pd.DataFrame) -> pd.DataFrame:
+def cleanup(df: pd.DataFrame, stats: Optional[dict] = None) -> pd.DataFrame:
     df = df.drop(
         columns=[
             'property_type', 'metro', 'address', 'area_m2', 'building', 'rooms_area',
             'balcony', 'windows', 'bathroom', 'kids_pets_allowed', 'extras',
             'building_series', 'elevator', 'garbage_chute', 'metro_station', 'metro_transport',
-            'floor', 'floors_total', 'area_room_combo', 'phone', 'internet', 'complex_name', 'description'
+            'floor', 'floors_total', 'area_room_combo', 'complex_name', 'description'
         ]
     )
     categorical_cols = ['room_type', 'building_type', 'parking', 'renovation', 'complex']
     for col in categorical_cols:
         df[col] = df[col].fillna('unknown')
     numeric_cols = ['ceiling_height', 'rooms', 'lat', 'lon', 'metro_minutes']
+    medians = _stat(stats, 'medians', lambda: {col: df[col].median() for col in numeric_cols})
     for col in numeric_cols:
-        df[col] = df[col].fillna(df[col].median())
+        df[col] = df[col].fillna(medians[col])
     return df
 
 
@@ -244,17 +250,53 @@ def expensive_extra(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def geo_features(df: pd.DataFrame) -> pd.DataFrame:
-    CITY_CENTERS = {
-        'Москва': (55.7558, 37.6173),
-        'Санкт-Петербург': (59.9343, 30.3351),
-        'Свердловская область': (56.8389, 60.6057),
-    }
+    df['dist_center'] = dist_center(df['city'], df['lat'], df['lon'])
+    return df
 
-    def geo_dist(row):
-        if row['city'] not in CITY_CENTERS:
-            return np.nan
-        lat0, lon0 = CITY_CENTERS[row['city']]
-        return np.sqrt((row['lat'] - lat0)**2 + (row['lon'] - lon0)**2)
 
-    df['dist_center'] = df.apply(geo_dist, axis=1)
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    for col in CATEGORY_COLS:
+        df[col] = df[col].astype('category')
+    for col in FLOAT32_COLS:
+        df[col] = df[col].astype(np.float32)
     return df
+
+
+def neighbour_features(df: pd.DataFrame,
+                       index: NeighbourIndex,
+                       exclude_self: bool = False) -> pd.DataFrame:
+    # Not a STAGE (the model is trained without these): add explicitly.
+    # Pass exclude_self=True for the rows the index was built from, so a
+    # listing's own price never becomes its feature.
+    df['knn_median_price'] = index.knn_median(df['lat'], df['lon'], exclude_self=exclude_self)
+    df['radius_median_price'] = index.radius_median(df['lat'], df['lon'], exclude_self=exclude_self)
+    return df
+
+
+STAGES = [
+    rename_and_basic_parse,
+    address_features,
+    rooms,
+    floors,
+    balcony_features,
+    extras_features,
+    area_features,
+    elevator,
+    bathroom,
+    complex_features,
+    rarity_index,
+    lux_anchor,
+    cleanup,
+    expensive_extra,
+    geo_features,
+    compact_dtypes,
+]
+
+STATEFUL_STAGES = {area_features, rarity_index, cleanup}
+
+
+if __name__ == "__main__":
+    from train_and_test.data import load_raw
+
+    pd.set_option('display.width', 200)
+    print(stage_timings(load_raw("train")).round(4))
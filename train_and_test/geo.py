@@ -0,0 +1,140 @@
+import math
+import statistics
+import warnings
+
+import numpy as np
+import pandas as pd
+
+CITY_CENTERS = {
+    'Москва': (55.7558, 37.6173),
+    'Санкт-Петербург': (59.9343, 30.3351),
+    'Свердловская область': (56.8389, 60.6057),
+}
+
+CITY_INDEX = pd.Index(list(CITY_CENTERS))
+# The trailing NaN row is what unknown cities (code -1) resolve to.
+CENTER_LAT = np.array([lat for lat, _ in CITY_CENTERS.values()] + [np.nan])
+CENTER_LON = np.array([lon for _, lon in CITY_CENTERS.values()] + [np.nan])
+
+
+def city_codes(city: pd.Series) -> np.ndarray:
+    return CITY_INDEX.get_indexer(city)
+
+
+def dist_center(city: pd.Series, lat: pd.Series, lon: pd.Series) -> np.ndarray:
+    codes = city_codes(city)
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    return np.sqrt((lat - CENTER_LAT[codes]) ** 2 + (lon - CENTER_LON[codes]) ** 2)
+
+
+EARTH_RADIUS_KM = 6371.0
+
+# Neighbourhood price defaults: k nearest listings, and the listings within
+# NEIGHBOUR_RADIUS_KM (at most NEIGHBOUR_MAX_RADIUS_COUNT of them, nearest
+# first) when at least NEIGHBOUR_MIN_COUNT fall inside it.
+NEIGHBOUR_K = 10
+NEIGHBOUR_RADIUS_KM = 1.0
+NEIGHBOUR_MIN_COUNT = 3
+NEIGHBOUR_MAX_RADIUS_COUNT = 64
+
+
+def to_cartesian_km(lat, lon) -> np.ndarray:
+    # Points on a sphere of Earth's radius: straight-line distance between
+    # them matches the great-circle distance to well under 0.1% at city
+    # scale, so a KD-tree over them answers queries in kilometres.
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    return EARTH_RADIUS_KM * np.column_stack([np.cos(lat) * np.cos(lon),
+                                              np.cos(lat) * np.sin(lon),
+                                              np.sin(lat)])
+
+
+def _nanmedian(prices: np.ndarray) -> np.ndarray:
+    with warnings.catch_warnings():
+        # Rows without any neighbour are expected and come back as NaN.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmedian(prices, axis=1)
+
+
+class NeighbourIndex:
+    # KD-tree over training listings with their prices. Batch methods take
+    # arrays (millions of rows per call); knn_median_one serves one listing.
+    def __init__(self, lat, lon, price):
+        from scipy.spatial import cKDTree
+
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        price = np.asarray(price, dtype=float)
+        keep = np.isfinite(lat) & np.isfinite(lon) & np.isfinite(price)
+        self.lat, self.lon, self.price = lat[keep], lon[keep], price[keep]
+        # Tree position of each row the index was built from (-1: dropped).
+        self._positions = np.where(keep, np.cumsum(keep) - 1, -1)
+        self.tree = cKDTree(to_cartesian_km(self.lat, self.lon))
+        # Index len(price) is what cKDTree returns for "no neighbour".
+        self._price_or_nan = np.append(self.price, np.nan)
+        self._price_list = self.price.tolist()
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "NeighbourIndex":
+        return cls(df['lat'], df['lon'], df['price'])
+
+    def save(self, path: str):
+        np.savez_compressed(path, lat=self.lat, lon=self.lon, price=self.price)
+
+    @classmethod
+    def load(cls, path: str) -> "NeighbourIndex":
+        with np.load(path) as data:
+            return cls(data['lat'], data['lon'], data['price'])
+
+    def _neighbour_prices(self, lat, lon, k: int, radius_km: float, exclude_self: bool) -> np.ndarray:
+        # exclude_self is for the rows the index was built from, in the same
+        # order: one extra neighbour is fetched and the row's own entry
+        # dropped. Listings in one building share coordinates, so it need
+        # not be the first; if k+1 others tie at distance zero it is not
+        # returned at all and the last one goes instead.
+        points = to_cartesian_km(lat, lon)
+        valid = np.isfinite(points).all(axis=1)
+        n_query = k + int(exclude_self)
+        idx = np.full((len(points), n_query), len(self.price))
+        if valid.any():
+            _, found = self.tree.query(points[valid], k=n_query,
+                                       distance_upper_bound=radius_km, workers=-1)
+            idx[valid] = np.asarray(found).reshape(-1, n_query)
+        if exclude_self:
+            if len(points) != len(self._positions):
+                raise ValueError(f"exclude_self needs the {len(self._positions)} rows the index was built from, "
+                                 f"got {len(points)}")
+            own = idx == self._positions[:, None]
+            drop = np.where(own.any(axis=1), own.argmax(axis=1), n_query - 1)
+            keep = np.ones(idx.shape, dtype=bool)
+            keep[np.arange(len(idx)), drop] = False
+            idx = idx[keep].reshape(len(idx), k)
+        return self._price_or_nan[idx]
+
+    def knn_median(self, lat, lon, k: int = NEIGHBOUR_K, exclude_self: bool = False) -> np.ndarray:
+        return _nanmedian(self._neighbour_prices(lat, lon, k, np.inf, exclude_self))
+
+    def radius_median(self, lat, lon,
+                      radius_km: float = NEIGHBOUR_RADIUS_KM,
+                      min_count: int = NEIGHBOUR_MIN_COUNT,
+                      exclude_self: bool = False) -> np.ndarray:
+        prices = self._neighbour_prices(lat, lon, NEIGHBOUR_MAX_RADIUS_COUNT, radius_km, exclude_self)
+        median = _nanmedian(prices)
+        median[np.isfinite(prices).sum(axis=1) < min_count] = np.nan
+        return median
+
+    def knn_median_one(self, lat: float, lon: float, k: int = NEIGHBOUR_K) -> float:
+        # Scalar twin of knn_median: plain math and a list median are several
+        # times cheaper than numpy on a single point.
+        if lat is None or lon is None or math.isnan(lat) or math.isnan(lon):
+            return float('nan')
+        lat, lon = math.radians(lat), math.radians(lon)
+        point = (EARTH_RADIUS_KM * math.cos(lat) * math.cos(lon),
+                 EARTH_RADIUS_KM * math.cos(lat) * math.sin(lon),
+                 EARTH_RADIUS_KM * math.sin(lat))
+        _, idx = self.tree.query(point, k=k)
+        return statistics.median(self._price_list[i] for i in np.atleast_1d(idx))
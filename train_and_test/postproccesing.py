@@ -1,64 +1,90 @@
 import numpy as np
 import pandas as pd
 import logging
+import time
+from typing import Optional
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def add_street_median_shrink(df_train: pd.DataFrame,
-                             df_test: pd.DataFrame) -> pd.Series:
-    logger.info("Calculating street median shrink...")
+COMPLEX_MEDIANS = {
+    "Четыре солнца": 3_700_000,
+    "Парк Палас": 2_300_000,
+    "Прайм Парк": 850_000,
+    "Смоленская Застава": 850_000,
+    "Дом на Озерковской": 650_000,
+    "Новопесковский": 550_000,
+    "Меркурий Тауэр": 575_000,
+    "Четыре Ветра": 490_000,
+    "Триумф-Палас": 450_000,
+    "Созвездие Капитал-1": 420_000,
+    "Клубный дом Печатников": 395_000,
+    "Поклонная 9": 330_000,
+    "Созвездие Капитал-2": 270_000
+}
+
+
+def build_calibration(df_train: pd.DataFrame) -> dict:
+    logger.info("Building calibration tables...")
+    # street may be categorical; group on plain strings so the table holds
+    # only observed streets under a string index.
+    moscow = df_train[df_train['city'] == 'Москва']
     moscow_street_median = (
-        df_train[df_train['city'] == 'Москва']
-        .groupby('street')['price']
+        moscow['price']
+        .groupby(moscow['street'].astype(object))
         .median()
+        .astype(float)
     )
-    street_median = df_test['street'].map(moscow_street_median)
-    global_median = df_train['price'].median()
-    return street_median.fillna(global_median)
+    return {
+        'street_median': moscow_street_median,
+        'global_median': float(df_train['price'].median()),
+        'expensive_threshold': float(np.percentile(df_train['price'], 90)),
+        'complex_median': pd.Series(COMPLEX_MEDIANS, dtype=float),
+        'complex_factor': 0.9,
+        'complex_median_increase': 1.05,
+    }
+
+
+def add_street_median_shrink(calibration: dict,
+                             df_test: pd.DataFrame,
+                             neighbour_median: Optional[np.ndarray] = None) -> pd.Series:
+    # Listings without a street median (no street, or one missing from the
+    # table) take the neighbourhood median when given, then the global one.
+    # Mapping a categorical street can give a categorical result; fillna
+    # needs plain floats.
+    street_median = df_test['street'].map(calibration['street_median']).astype(float)
+    if neighbour_median is not None:
+        street_median = street_median.fillna(pd.Series(neighbour_median, index=df_test.index))
+    return street_median.fillna(calibration['global_median'])
 
 
 def blend_expensive_flats(predictions: np.ndarray,
                           df_test: pd.DataFrame,
                           street_median: pd.Series,
-                          alpha: float = 0.25) -> np.ndarray:
-    threshold = np.percentile(predictions, 90)
-    high_price_mask = (df_test['city'] == 'Москва') & (predictions > threshold)
-    logger.info(f"Blending {high_price_mask.sum()} expensive flats...")
+                          alpha: float = 0.25,
+                          threshold: Optional[float] = None) -> np.ndarray:
+    if threshold is None:
+        threshold = np.percentile(predictions, 90)
+    high_price_mask = ((df_test['city'] == 'Москва').to_numpy()
+                       & (predictions > threshold))
+    logger.debug(f"Blending {high_price_mask.sum()} expensive flats...")
     blended = predictions.copy()
     blended[high_price_mask] = (
         (1 - alpha) * predictions[high_price_mask] +
-        alpha * street_median.loc[high_price_mask]
+        alpha * street_median.to_numpy()[high_price_mask]
     )
     return blended
 
 
 def apply_complex_corrections(predictions: np.ndarray,
-                              df_test: pd.DataFrame) -> np.ndarray:
-    complex_medians = {
-        "Четыре солнца": 3_700_000,
-        "Парк Палас": 2_300_000,
-        "Прайм Парк": 850_000,
-        "Смоленская Застава": 850_000,
-        "Дом на Озерковской": 650_000,
-        "Новопесковский": 550_000,
-        "Меркурий Тауэр": 575_000,
-        "Четыре Ветра": 490_000,
-        "Триумф-Палас": 450_000,
-        "Созвездие Капитал-1": 420_000,
-        "Клубный дом Печатников": 395_000,
-        "Поклонная 9": 330_000,
-        "Созвездие Капитал-2": 270_000
-    }
-    factor = 0.9
-    median_increase = 1.05
+                              df_test: pd.DataFrame,
+                              calibration: dict) -> np.ndarray:
+    complex_median = df_test['complex'].map(calibration['complex_median']).to_numpy(dtype=float)
+    low_price_mask = predictions < complex_median * calibration['complex_factor']
     corrected = predictions.copy()
-    for complex_name, median_price in complex_medians.items():
-        mask = df_test['complex'] == complex_name
-        low_price_mask = mask & (corrected < median_price * factor)
-        corrected[low_price_mask] = median_price * median_increase
-        logger.info(f"Corrected {low_price_mask.sum()} flats in {complex_name}")
+    corrected[low_price_mask] = complex_median[low_price_mask] * calibration['complex_median_increase']
+    logger.debug(f"Corrected {low_price_mask.sum()} flats in premium complexes")
     return corrected
 
 
@@ -66,13 +92,62 @@ def round_prices(predictions: np.ndarray, step: int = 5000) -> np.ndarray:
     return np.floor(predictions / step) * step
 
 
+def calibrate_prediction(prediction: float,
+                         calibration: dict,
+                         city: Optional[str],
+                         street: Optional[str],
+                         complex_name: Optional[str],
+                         alpha: float = 0.25,
+                         step: int = 5000,
+                         timings: Optional[dict] = None,
+                         neighbour_median: Optional[float] = None) -> float:
+    # Step timings use the names of the batch functions they mirror.
+    started = time.perf_counter()
+    if city == 'Москва' and prediction > calibration['expensive_threshold']:
+        street_median = calibration['street_median'].get(street)
+        if street_median is None and neighbour_median is not None and not np.isnan(neighbour_median):
+            street_median = neighbour_median
+        if street_median is None:
+            street_median = calibration['global_median']
+        prediction = (1 - alpha) * prediction + alpha * street_median
+    blended = time.perf_counter()
+
+    complex_median = calibration['complex_median'].get(complex_name)
+    if complex_median is not None and prediction < complex_median * calibration['complex_factor']:
+        prediction = complex_median * calibration['complex_median_increase']
+    corrected = time.perf_counter()
+
+    prediction = float(np.floor(prediction / step) * step)
+    if timings is not None:
+        timings['blend_expensive_flats'] = blended - started
+        timings['apply_complex_corrections'] = corrected - blended
+        timings['round_prices'] = time.perf_counter() - corrected
+    return prediction
+
+
 def calibrate_predictions(predictions: np.ndarray,
-                          df_train: pd.DataFrame,
-                          df_test: pd.DataFrame) -> np.ndarray:
-    logger.info("Starting prediction calibration...")
-    street_median = add_street_median_shrink(df_train, df_test)
-    predictions = blend_expensive_flats(predictions, df_test, street_median)
-    predictions = apply_complex_corrections(predictions, df_test)
+                          calibration: dict,
+                          df_test: pd.DataFrame,
+                          timings: Optional[dict] = None,
+                          neighbour_median: Optional[np.ndarray] = None) -> np.ndarray:
+    logger.debug("Starting prediction calibration...")
+    if timings is None:
+        timings = {}
+    started = time.perf_counter()
+    street_median = add_street_median_shrink(calibration, df_test, neighbour_median)
+    timings['add_street_median_shrink'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    predictions = blend_expensive_flats(predictions, df_test, street_median,
+                                        threshold=calibration['expensive_threshold'])
+    timings['blend_expensive_flats'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    predictions = apply_complex_corrections(predictions, df_test, calibration)
+    timings['apply_complex_corrections'] = time.perf_counter() - started
+
+    started = time.perf_counter()
     predictions = round_prices(predictions)
-    logger.info("Calibration done.")
+    timings['round_prices'] = time.perf_counter() - started
+    logger.debug("Calibration done.")
     return predictions
@@ -1,41 +1,47 @@
-import pandas as pd
-import numpy as np
+import argparse
 import joblib
 import logging
 import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
 
+from train_and_test.data import as_raw_text, load_prepared, read_chunks
 from train_and_test.features_engineering import prepare_data
 from train_and_test.postproccesing import calibrate_predictions
 from train_and_test.config import FEATURES, BASE_DIR
+from train_and_test.ensemble import MODEL_PATH, load_ensemble
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+ARTIFACTS_DIR = os.path.join(BASE_DIR, "server", "artifacts")
+
+_worker_state = {}
+
 
 def predict():
     logger.info("Loading test data...")
-    test_df = pd.read_excel(os.path.join(BASE_DIR, "data/raw/test.xlsx"))
-    logger.info("Preparing test data...")
-    test_df = prepare_data(test_df)
+    test_df = load_prepared("test")
 
-    logger.info("Loading train data for calibration...")
-    train_df = pd.read_excel(os.path.join(BASE_DIR, "data/raw/train.xlsx"))
-    train_df = prepare_data(train_df)
+    logger.info("Loading calibration tables...")
+    calibration = joblib.load(os.path.join(BASE_DIR, "server/artifacts/calibration.pkl"))
 
     logger.info("Loading trained models...")
-    models = joblib.load(os.path.join(BASE_DIR, "model/catboost_model.pkl"))
+    with open(MODEL_PATH, "rb") as f:
+        ensemble = load_ensemble(f.read())
 
     X_test = test_df[FEATURES]
 
     logger.info("Generating raw predictions...")
-    raw_preds = np.zeros(len(X_test))
-    for model in models:
-        raw_preds += np.expm1(model.predict(X_test)) / len(models)
+    raw_preds = ensemble.predict(X_test)
 
     logger.info("Calibrating predictions...")
     final_preds = calibrate_predictions(
-        preds=raw_preds,
-        df_train=train_df,
+        predictions=raw_preds,
+        calibration=calibration,
         df_test=test_df
     )
 
@@ -45,7 +51,85 @@ def predict():
     return test_df
 
 
+def load_scoring_state() -> dict:
+    with open(MODEL_PATH, "rb") as f:
+        ensemble = load_ensemble(f.read())
+    return {
+        "ensemble": ensemble,
+        "calibration": joblib.load(os.path.join(ARTIFACTS_DIR, "calibration.pkl")),
+        "stats": joblib.load(os.path.join(ARTIFACTS_DIR, "prepare_stats.pkl")),
+    }
+
+
+def _init_worker():
+    _worker_state.update(load_scoring_state())
+
+
+def score_chunk(chunk: pd.DataFrame, state: dict = None) -> pd.DataFrame:
+    state = state or _worker_state
+    prepared = prepare_data(as_raw_text(chunk), stats=state["stats"])
+    raw_preds = state["ensemble"].predict(prepared[FEATURES])
+    final_preds = calibrate_predictions(raw_preds, state["calibration"], prepared)
+    return pd.DataFrame({
+        "listing_id": prepared["listing_id"].to_numpy(),
+        "predicted_price": final_preds,
+    })
+
+
+def score_chunks(chunks, workers: int):
+    if workers <= 1:
+        state = load_scoring_state()
+        for chunk in chunks:
+            yield score_chunk(chunk, state)
+        return
+
+    # At most 2 chunks per worker are read ahead, which bounds memory; results
+    # are yielded in input order.
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(score_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def predict_stream(input_path: str, output_path: str, chunk_size: int = 50_000, workers: int = 1):
+    started = time.perf_counter()
+    rows = 0
+    writer = None
+    try:
+        for i, result in enumerate(score_chunks(read_chunks(input_path, chunk_size), workers)):
+            if output_path.endswith(".parquet"):
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                table = pa.Table.from_pandas(result, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+            else:
+                result.to_csv(output_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            rows += len(result)
+            logger.info(f"Chunk {i}: {rows} rows scored ({time.perf_counter() - started:.1f}s)")
+    finally:
+        if writer is not None:
+            writer.close()
+    logger.info(f"Scored {rows} rows into {output_path} in {time.perf_counter() - started:.1f}s")
+
+
 if __name__ == "__main__":
-    df_result = predict()
-    df_result.to_csv(os.path.join(BASE_DIR, "data/processed/predictions.csv"), index=False)
-    logger.info("Predictions saved to data/processed/predictions.csv")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="CSV or Parquet file with raw listings; scored in chunks")
+    parser.add_argument("--output", help="CSV or Parquet file for listing_id, predicted_price")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes scoring chunks")
+    args = parser.parse_args()
+
+    if args.input:
+        predict_stream(args.input, args.output or os.path.join(BASE_DIR, "data/processed/predictions_stream.csv"),
+                       args.chunk_size, args.workers)
+    else:
+        df_result = predict()
+        df_result.to_csv(os.path.join(BASE_DIR, "data/processed/predictions.csv"), index=False)
+        logger.info("Predictions saved to data/processed/predictions.csv")
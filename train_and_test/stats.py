@@ -0,0 +1,63 @@
+import numpy as np
+
+# Values kept before a sketch starts compressing. Below it quantiles are
+# exact (same interpolation as pandas); above it the rank error is about
+# 2 / SKETCH_CAPACITY.
+SKETCH_CAPACITY = 100_000
+
+
+class QuantileSketch:
+    # Mergeable quantile summary: weighted points sorted by value. While the
+    # total stays under capacity every point is a raw value with weight 1;
+    # past it, adjacent points are collapsed into capacity / 2 bins of equal
+    # weight.
+    def __init__(self, capacity: int = SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.values = np.empty(0)
+        self.weights = np.empty(0)
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    @property
+    def exact(self) -> bool:
+        return bool(np.all(self.weights == 1))
+
+    def add(self, values) -> "QuantileSketch":
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        return self._extend(values, np.ones(len(values)))
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        return self._extend(other.values, other.weights)
+
+    def _extend(self, values: np.ndarray, weights: np.ndarray) -> "QuantileSketch":
+        values = np.concatenate([self.values, values])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(values, kind="stable")
+        self.values, self.weights = values[order], weights[order]
+        if len(self.values) > self.capacity:
+            self._compress()
+        return self
+
+    def _compress(self):
+        bins = self.capacity // 2
+        cumulative = np.cumsum(self.weights)
+        bin_ids = np.minimum((cumulative - self.weights) * bins // cumulative[-1], bins - 1).astype(np.int64)
+        weights = np.bincount(bin_ids, weights=self.weights, minlength=bins)
+        sums = np.bincount(bin_ids, weights=self.values * self.weights, minlength=bins)
+        keep = weights > 0
+        self.values, self.weights = sums[keep] / weights[keep], weights[keep]
+
+    def quantile(self, q: float) -> float:
+        if len(self.values) == 0:
+            return float("nan")
+        if self.exact:
+            return float(np.quantile(self.values, q))
+        # Each point sits at the middle of the rank range it stands for.
+        positions = (np.cumsum(self.weights) - self.weights / 2) / self.count
+        return float(np.interp(q, positions, self.values))
+
+    def median(self) -> float:
+        return self.quantile(0.5)
@@ -0,0 +1,103 @@
+import argparse
+import json
+import logging
+import time
+
+import numpy as np
+from catboost import CatBoostRegressor
+from sklearn.model_selection import train_test_split
+
+from train_and_test.config import CAT_FEATURES, FEATURES, LATENCY_TIERS, SEEDS, TARGET
+from train_and_test.data import load_prepared
+from train_and_test.ensemble import FusedEnsemble
+from train_and_test.postproccesing import build_calibration, calibrate_predictions
+from train_and_test.train import MODEL_PARAMS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HOLDOUT_FRACTION = 0.2
+# A single /predict call and a full micro-batch.
+LATENCY_ROWS = [1, 64]
+
+
+def holdout_ensemble(seeds: list = SEEDS, holdout: float = HOLDOUT_FRACTION) -> tuple:
+    # The served model is trained on all of train and test has no prices, so
+    # tiers are compared on an ensemble trained like it on the rest of train.
+    df = load_prepared("train")
+    train_df, holdout_df = train_test_split(df, test_size=holdout, random_state=0)
+    models = []
+    for seed in seeds:
+        started = time.perf_counter()
+        model = CatBoostRegressor(**MODEL_PARAMS, random_seed=seed, allow_writing_files=False)
+        model.fit(train_df[FEATURES], np.log1p(train_df[TARGET]), cat_features=CAT_FEATURES)
+        models.append(model)
+        logger.info(f"Seed {seed} trained in {time.perf_counter() - started:.1f}s")
+    return FusedEnsemble.from_models(models), train_df, holdout_df
+
+
+def _latency_ms(fn, repeats: int) -> float:
+    fn()
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings)) * 1000
+
+
+def tier_report(ensemble: FusedEnsemble, train_df, holdout_df, tiers: dict = LATENCY_TIERS,
+                repeats: int = 50) -> dict:
+    # MAE in rubles of the calibrated price (what /predict returns) and of
+    # the raw ensemble output, and the median ensemble latency per call.
+    calibration = build_calibration(train_df)
+    X = holdout_df[FEATURES]
+    y = holdout_df[TARGET].to_numpy()
+    rows = X.to_numpy(dtype=object).tolist()
+
+    report = {}
+    for name, tier in tiers.items():
+        raw = ensemble.predict(X, tier["seeds"], tier["trees"])
+        price = calibrate_predictions(raw, calibration, holdout_df)
+        report[name] = {
+            **tier,
+            "mae": float(np.mean(np.abs(price - y))),
+            "raw_mae": float(np.mean(np.abs(raw - y))),
+            "latency_ms": {n: _latency_ms(lambda: ensemble.predict(rows[:n], tier["seeds"], tier["trees"]), repeats)
+                           for n in LATENCY_ROWS},
+        }
+
+    full = report[next(iter(tiers))]
+    for result in report.values():
+        result["mae_increase"] = result["mae"] - full["mae"]
+        result["speedup"] = {n: full["latency_ms"][n] / result["latency_ms"][n] for n in LATENCY_ROWS}
+    return report
+
+
+def _tier(value: str) -> tuple:
+    # name=seeds:trees, either left empty for all
+    name, spec = value.split("=", 1)
+    seeds, trees = spec.split(":")
+    return name, {"seeds": int(seeds) if seeds else None, "trees": int(trees) if trees else None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tier", type=_tier, action="append", default=[],
+                        help="extra tier to evaluate as name=seeds:trees, e.g. seeds3=3: or short=5:800; repeatable")
+    parser.add_argument("--holdout", type=float, default=HOLDOUT_FRACTION)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--output", default=None, help="write the report as JSON")
+    args = parser.parse_args()
+
+    ensemble, train_df, holdout_df = holdout_ensemble(holdout=args.holdout)
+    report = tier_report(ensemble, train_df, holdout_df, {**LATENCY_TIERS, **dict(args.tier)}, args.repeats)
+    print(f"{'tier':<10} {'seeds':>5} {'trees':>5} {'MAE':>8} {'+MAE':>7} {'raw MAE':>8} "
+          + " ".join(f"{f'{n} row ms':>9} {'x':>5}" for n in LATENCY_ROWS))
+    for name, result in report.items():
+        print(f"{name:<10} {result['seeds'] or 'all':>5} {result['trees'] or 'all':>5} {result['mae']:>8.0f} "
+              f"{result['mae_increase']:>+7.0f} {result['raw_mae']:>8.0f} "
+              + " ".join(f"{result['latency_ms'][n]:>9.2f} {result['speedup'][n]:>5.1f}" for n in LATENCY_ROWS))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
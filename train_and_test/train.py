@@ -1,39 +1,87 @@
-import pandas as pd
-import numpy as np
+import argparse
 import joblib
 import logging
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 from catboost import CatBoostRegressor
-from train_and_test.features_engineering import prepare_data
-from train_and_test.config import FEATURES, CAT_FEATURES, TARGET, SEEDS, BASE_DIR
+from train_and_test.data import cached_pool, load_pool
+from train_and_test.config import SEEDS, BASE_DIR
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+MODEL_PARAMS = dict(
+    iterations=1900,
+    learning_rate=0.05,
+    depth=7,
+    eval_metric='MAE',
+    verbose=False
+)
 
-def train():
+_shared = {}
+
+
+def fit_seed(pool, seed: int, thread_count: int = -1) -> CatBoostRegressor:
+    # The pool is already quantized, so fitting skips feature quantization
+    # and categorical encoding.
+    model = CatBoostRegressor(**MODEL_PARAMS, random_seed=seed, thread_count=thread_count)
+    model.fit(pool)
+    return model
+
+
+def _init_worker(pool_path: str):
+    # Runs once per worker process: each worker reads the cached pool once
+    # instead of receiving the data for every seed.
+    _shared['pool'] = load_pool(pool_path)
+
+
+def _fit_shared_seed(seed: int, thread_count: int):
+    started = time.perf_counter()
+    model = fit_seed(_shared['pool'], seed, thread_count)
+    return model, time.perf_counter() - started
+
+
+def train_parallel(pool_path: str, workers: int = None) -> list:
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, len(SEEDS)))
+    thread_count = max(1, cores // workers)
+    logger.info(f"Training {len(SEEDS)} seeds on {workers} workers x {thread_count} threads...")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pool_path,)) as pool:
+        futures = [pool.submit(_fit_shared_seed, seed, thread_count) for seed in SEEDS]
+        models = []
+        for seed, future in zip(SEEDS, futures):
+            model, elapsed = future.result()
+            logger.info(f"Seed {seed} trained in {elapsed:.1f}s")
+            models.append(model)
+    return models
+
+
+def train(parallel: bool = False, workers: int = None):
     logger.info("Loading training data...")
-    train_df = pd.read_excel(os.path.join(BASE_DIR, "data/raw/train.xlsx"))
-    logger.info("Preparing training data...")
-    train_df = prepare_data(train_df)
-
-    X = train_df[FEATURES]
-    y = np.log1p(train_df[TARGET])
-
-    models = []
-    for seed in SEEDS:
-        logger.info(f"Training model with seed {seed}...")
-        model = CatBoostRegressor(
-            iterations=1900,
-            learning_rate=0.05,
-            depth=7,
-            eval_metric='MAE',
-            random_seed=seed,
-            verbose=False
-        )
-        model.fit(X, y, cat_features=CAT_FEATURES)
-        models.append(model)
+    started = time.perf_counter()
+    pool_path, build_seconds, from_cache = cached_pool("train")
+    pool = load_pool(pool_path)
+    load_seconds = time.perf_counter() - started
+    if from_cache:
+        logger.info(f"Quantized pool loaded from cache in {load_seconds:.2f}s, "
+                    f"saving {build_seconds - load_seconds:.2f}s of data preparation and quantization")
+    else:
+        logger.info(f"Quantized pool built in {load_seconds:.2f}s and cached for the next runs")
+
+    started = time.perf_counter()
+    if parallel:
+        models = train_parallel(pool_path, workers)
+    else:
+        models = []
+        for seed in SEEDS:
+            logger.info(f"Training model with seed {seed}...")
+            seed_started = time.perf_counter()
+            models.append(fit_seed(pool, seed))
+            logger.info(f"Seed {seed} trained in {time.perf_counter() - seed_started:.1f}s")
+    logger.info(f"Trained {len(models)} models in {time.perf_counter() - started:.1f}s wall-clock")
 
     logger.info("Saving models to model/catboost_model.pkl...")
     joblib.dump(models, os.path.join(BASE_DIR, "model/catboost_model.pkl"))
@@ -41,6 +89,8 @@ def train():
 
 
 if __name__ == "__main__":
-    train()
-
-
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--parallel", action="store_true", help="fit the seeds concurrently in a process pool")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per seed, capped by cores)")
+    args = parser.parse_args()
+    train(parallel=args.parallel, workers=args.workers)